@@ -1,11 +1,21 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Query as QueryParam
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import datetime
+import functools
+import itertools
+import json
+import os
 import sys
 
 # Import blockchain class
-from blockchain import HealthBlockchain, WalletManager
+from blockchain import HealthBlockchain, WalletManager, KeyDerivationCache, parse_fields, to_micros
+from query import Query
 
 app = FastAPI(title="RS MediTrust Blockchain API")
 
@@ -18,8 +28,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize blockchain
-blockchain = HealthBlockchain()
+# Cache of public keys/addresses derived at login
+WalletManager.key_cache = KeyDerivationCache(
+    maxsize=int(os.environ.get("MEDITRUST_KEY_CACHE_SIZE", 1024)),
+    ttl=int(os.environ.get("MEDITRUST_KEY_CACHE_TTL", 900))
+)
+
+# Payload keys /query can look up by value, comma-separated
+if "MEDITRUST_INDEXED_DATA_KEYS" in os.environ:
+    HealthBlockchain.INDEXED_DATA_KEYS = tuple(
+        key.strip() for key in os.environ["MEDITRUST_INDEXED_DATA_KEYS"].split(",") if key.strip()
+    )
+
+# Initialize blockchain (persisted under MEDITRUST_DATA_DIR)
+blockchain = HealthBlockchain(data_dir=os.environ.get("MEDITRUST_DATA_DIR", "data"))
+if "MEDITRUST_ACCESS_REQUEST_TTL_HOURS" in os.environ:
+    blockchain.ACCESS_REQUEST_TTL = datetime.timedelta(hours=int(os.environ["MEDITRUST_ACCESS_REQUEST_TTL_HOURS"]))
 
 # Pydantic models
 class UserRegistration(BaseModel):
@@ -40,6 +64,9 @@ class HealthDataInput(BaseModel):
     user_address: str
     expiry_years: int = 5
 
+class HealthDataBatch(BaseModel):
+    records: List[HealthDataInput]
+
 class Login(BaseModel):
     private_key_hex: str
 
@@ -53,12 +80,88 @@ class AccessRequestSign(BaseModel):
     signer_address: str
     private_key_hex: str
 
+class AccessRequestVerify(BaseModel):
+    request_ids: Optional[List[str]] = None
+    workers: Optional[int] = None
+
+class BlockQuery(BaseModel):
+    user_address: str
+    request_id: Optional[str] = None
+    patient_id: Optional[str] = None
+    creator_address: Optional[str] = None
+    access_level: Optional[str] = None
+    since: Optional[datetime.datetime] = None
+    until: Optional[datetime.datetime] = None
+    data: Dict[str, Any] = {}  # payload key -> value equality filters
+    fields: Optional[str] = None
+    cursor: Optional[int] = None
+    limit: int = Field(100, ge=1, le=1000)
+
+EXPIRY_SWEEP_SECONDS = int(os.environ.get("MEDITRUST_EXPIRY_SWEEP_SECONDS", 3600))
+SNAPSHOT_SECONDS = int(os.environ.get("MEDITRUST_SNAPSHOT_SECONDS", 300))
+CRYPTO_WORKERS = int(os.environ.get("MEDITRUST_CRYPTO_WORKERS", os.cpu_count() or 1))
+FEED_KEEPALIVE_SECONDS = int(os.environ.get("MEDITRUST_FEED_KEEPALIVE_SECONDS", 15))
+# Streams end after this long so servers can shut down; EventSource reconnects with Last-Event-ID
+FEED_STREAM_SECONDS = int(os.environ.get("MEDITRUST_FEED_STREAM_SECONDS", 300))
+
+# Pure-Python ECDSA runs in worker processes so it never blocks the event loop
+crypto_pool = ProcessPoolExecutor(max_workers=CRYPTO_WORKERS)
+
+async def run_crypto(func, *args):
+    """Run a CPU-bound WalletManager call in the crypto process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(crypto_pool, functools.partial(func, *args))
+
+async def derive_public_info(private_key_hex):
+    """Public key/address for a private key, from the cache or the crypto pool"""
+    wallet_info = WalletManager.key_cache.get(private_key_hex)
+    if wallet_info is None:
+        wallet_info = await run_crypto(WalletManager.public_key_record, private_key_hex)
+        if wallet_info:
+            WalletManager.key_cache.put(private_key_hex, wallet_info)
+    return wallet_info
+
+async def expiry_sweeper():
+    """Periodically mark expired blocks and purge stale pending access requests"""
+    while True:
+        try:
+            expired = await run_in_threadpool(blockchain.clean_expired_blocks)
+            if expired:
+                print(f"Marked {expired} blocks as expired")
+            purged = await run_in_threadpool(blockchain.purge_expired_requests)
+            if purged:
+                print(f"Purged {purged} expired access requests")
+        except Exception as e:
+            print(f"Error sweeping expired blocks: {e}")
+        await asyncio.sleep(EXPIRY_SWEEP_SECONDS)
+
+async def snapshotter():
+    """Periodically snapshot in-memory state so restarts replay only recent events"""
+    while True:
+        await asyncio.sleep(SNAPSHOT_SECONDS)
+        try:
+            await run_in_threadpool(blockchain.save_snapshot)
+        except Exception as e:
+            print(f"Error writing snapshot: {e}")
+
+@app.on_event("startup")
+async def startup():
+    app.state.expiry_sweeper = asyncio.create_task(expiry_sweeper())
+    app.state.snapshotter = asyncio.create_task(snapshotter())
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.expiry_sweeper.cancel()
+    app.state.snapshotter.cancel()
+    crypto_pool.shutdown(cancel_futures=True)
+    blockchain.close()
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "RS MediTrust Blockchain API", "status": "running"}
 
 @app.post("/register")
-def register_user(user: UserRegistration):
+async def register_user(user: UserRegistration):
     try:
         profile_data = {
             'nama': user.nama,
@@ -69,12 +172,21 @@ def register_user(user: UserRegistration):
             'specialization': user.specialization
         }
 
-        wallet = blockchain.register_user(
-            user.role,
-            profile_data,
-            private_key_hex=user.private_key_hex,
-            patient_id=user.patient_id
-        )
+        if user.private_key_hex:
+            wallet_info = await derive_public_info(user.private_key_hex)
+        else:
+            wallet_info = await run_crypto(WalletManager.generate_wallet_record)
+
+        wallet = None
+        if wallet_info:
+            wallet = await run_in_threadpool(
+                blockchain.register_user,
+                user.role,
+                profile_data,
+                private_key_hex=user.private_key_hex,
+                patient_id=user.patient_id,
+                wallet_info=wallet_info
+            )
 
         if wallet:
             return {
@@ -88,9 +200,12 @@ def register_user(user: UserRegistration):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/login")
-def login(credentials: Login):
+async def login(credentials: Login):
     try:
-        result = blockchain.login_with_private_key(credentials.private_key_hex)
+        wallet_info = await derive_public_info(credentials.private_key_hex)
+        if not wallet_info:
+            raise HTTPException(status_code=401, detail="Invalid private key")
+        result = blockchain.login_with_private_key(credentials.private_key_hex, wallet_info)
         if "error" in result:
             raise HTTPException(status_code=401, detail=result["error"])
         return {"success": True, "data": result}
@@ -98,9 +213,11 @@ def login(credentials: Login):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/health-data")
-def add_health_data(data: HealthDataInput):
+async def add_health_data(data: HealthDataInput):
     try:
-        success = blockchain.add_block(
+        # Writers may wait on the chain lock, so they run off the event loop
+        success = await run_in_threadpool(
+            blockchain.add_block,
             data.patient_id,
             data.data,
             data.access_level,
@@ -114,18 +231,173 @@ def add_health_data(data: HealthDataInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/health-data/batch")
+async def add_health_data_batch(batch: HealthDataBatch):
+    try:
+        results = await run_in_threadpool(
+            blockchain.add_blocks, [record.model_dump() for record in batch.records]
+        )
+        accepted = sum(1 for result in results if result['success'])
+        return {
+            "success": True,
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def local_micros(moment):
+    """Epoch microseconds of a request datetime in the chain's naive local time"""
+    if moment is None:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return to_micros(moment)
+
 @app.get("/patient-data/{patient_id}")
-def get_patient_data(patient_id: str, user_address: str, request_id: Optional[str] = None):
+async def get_patient_data(patient_id: str, user_address: str, request_id: Optional[str] = None,
+                           cursor: Optional[int] = None, limit: Optional[int] = None, stream: bool = False,
+                           fields: Optional[str] = None, since: Optional[datetime.datetime] = None,
+                           until: Optional[datetime.datetime] = None):
+    # fields: comma-separated projection, e.g. "timestamp,created_by,data.diagnosis"
+    # since/until: creation time window [since, until)
+    if fields is not None:
+        try:
+            parse_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    window = {"since_us": local_micros(since), "until_us": local_micros(until)}
+    try:
+        if stream:
+            # NDJSON: one {"height", "category", "record"} object per line
+            records = blockchain.iter_patient_data(patient_id, user_address, request_id, after=cursor,
+                                                   fields=fields, **window)
+            if limit:
+                records = itertools.islice(records, limit)
+            lines = (
+                json.dumps({"height": height, "category": category, "record": block_info}) + "\n"
+                for height, category, block_info in records
+            )
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+        # Blob-store payloads are read and decompressed from disk, so build views off the event loop
+        if cursor is None and limit is None:
+            data = await run_in_threadpool(blockchain.get_patient_data, patient_id, user_address, request_id,
+                                           fields=fields, **window)
+            return {"success": True, "data": data}
+
+        # Cursor pagination by block height
+        def page():
+            data = {'public': [], 'private': [], 'patient': [], 'expired': []}
+            next_cursor = None
+            records = blockchain.iter_patient_data(patient_id, user_address, request_id, after=cursor,
+                                                   fields=fields, **window)
+            for count, (height, category, block_info) in enumerate(records, 1):
+                data[category].append(block_info)
+                if count == (limit or 100):
+                    next_cursor = height
+                    break
+            return data, next_cursor
+
+        data, next_cursor = await run_in_threadpool(page)
+        return {"success": True, "data": data, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/chain/tail")
+async def get_chain_tail(user_address: str, since: datetime.datetime, cursor: Optional[int] = None,
+                         limit: int = QueryParam(100, ge=1, le=1000), fields: Optional[str] = None):
+    """Blocks created since a point in time that the user may read, oldest first"""
+    if fields is not None:
+        try:
+            parse_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # Views of blob-store blocks read and decompress files, so keep them off the event loop
+        results, next_cursor = await run_in_threadpool(
+            blockchain.chain_tail, user_address, local_micros(since), cursor, limit, fields
+        )
+        return {"success": True, "data": results, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/events")
+async def change_events(request: Request, user_address: str, patient_id: Optional[str] = None,
+                        request_id: Optional[str] = None, cursor: Optional[int] = None,
+                        fields: Optional[str] = None):
+    """
+    Server-sent events for new blocks, patient conversions and access-request signatures
+
+    Each event's id is its feed sequence number. Resume with cursor= or the
+    Last-Event-ID header; without either the stream starts at the current tip.
+    """
+    try:
+        projection = parse_fields(fields) if fields is not None else None
+        last_event_id = request.headers.get("last-event-id")
+        if cursor is None and last_event_id:
+            cursor = int(last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        deadline = asyncio.get_running_loop().time() + FEED_STREAM_SECONDS
+        skipped = None  # seq of the last event filtered out since the last one sent
+        yield "retry: 1000\n\n"
+        async for event in blockchain.feed.listen(cursor, FEED_KEEPALIVE_SECONDS):
+            if event is None:
+                # An id-only message moves the client's Last-Event-ID past filtered events
+                yield f"id: {skipped}\n\n" if skipped else ": keepalive\n\n"
+                skipped = None
+            elif event[1] == 'reset':
+                yield f"id: {event[0]}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                # A block view may load its payload from the blob store
+                view = await run_in_threadpool(blockchain.feed_view, user_address, event,
+                                               patient_id, request_id, projection)
+                if view is None:
+                    skipped = event[0]
+                else:
+                    skipped = None
+                    yield f"id: {event[0]}\nevent: {event[1]}\ndata: {json.dumps(view)}\n\n"
+            if asyncio.get_running_loop().time() >= deadline:
+                break
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/query")
+async def query_blocks(request: BlockQuery):
+    """Blocks matching all given filters that the user may read, in chain order"""
+    if request.fields is not None:
+        try:
+            parse_fields(request.fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        data = blockchain.get_patient_data(patient_id, user_address, request_id)
-        return {"success": True, "data": data}
+        query = Query(
+            patient_id=request.patient_id,
+            creator_address=request.creator_address,
+            access_level=request.access_level,
+            since_us=local_micros(request.since),
+            until_us=local_micros(request.until),
+            data=request.data
+        )
+        # Building a payload-key index on first use scans the chain, so keep it off the event loop
+        results, next_cursor, plan = await run_in_threadpool(
+            blockchain.query, request.user_address, query, request.request_id,
+            request.cursor, request.limit, request.fields
+        )
+        return {"success": True, "data": results, "next_cursor": next_cursor, "plan": plan}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/access-request")
-def create_access_request(request: AccessRequestCreate):
+async def create_access_request(request: AccessRequestCreate):
     try:
-        request_id = blockchain.create_access_request(
+        request_id = await run_in_threadpool(
+            blockchain.create_access_request,
             request.patient_id,
             request.requester_address,
             request.data_type
@@ -134,13 +406,46 @@ def create_access_request(request: AccessRequestCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/access-requests")
+async def list_access_requests(patient_id: Optional[str] = None, requester: Optional[str] = None,
+                               status: Optional[str] = None, signer: Optional[str] = None,
+                               cursor: Optional[int] = None, limit: int = QueryParam(50, ge=1, le=500)):
+    try:
+        requests, next_cursor = await run_in_threadpool(
+            blockchain.list_access_requests,
+            patient_id, requester, status, signer, cursor, limit
+        )
+        return {"success": True, "data": requests, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/access-request/{request_id}")
+async def get_access_request(request_id: str):
+    try:
+        request = blockchain.access_requests.get(request_id)
+        if not request:
+            raise HTTPException(status_code=404, detail="Request not found")
+        return {"success": True, "data": request.to_dict()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/access-request/sign")
-def sign_access_request(signature: AccessRequestSign):
+async def sign_access_request(signature: AccessRequestSign):
     try:
-        success, message = blockchain.sign_access_request(
+        request = blockchain.access_requests.get(signature.request_id)
+        signed = None
+        if request:
+            signed = await run_crypto(WalletManager.sign_message, signature.private_key_hex,
+                                      request.signing_message())
+        # Reaching the threshold verifies every signature, so keep it off the event loop
+        success, message = await run_in_threadpool(
+            blockchain.sign_access_request,
             signature.request_id,
             signature.signer_address,
-            signature.private_key_hex
+            signature.private_key_hex,
+            signature=signed
         )
         if success:
             return {"success": True, "message": message}
@@ -149,22 +454,74 @@ def sign_access_request(signature: AccessRequestSign):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/access-request/verify")
+async def verify_access_requests(batch: AccessRequestVerify):
+    try:
+        # Bulk verification of pending signatures, chunked across the shared crypto pool
+        result = await run_in_threadpool(
+            blockchain.verify_pending_requests,
+            batch.request_ids,
+            batch.workers or CRYPTO_WORKERS,
+            executor=crypto_pool
+        )
+        return {"success": True, **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/verify-chain")
-def verify_blockchain():
+async def verify_blockchain(full: bool = False, start: Optional[int] = None, end: Optional[int] = None,
+                            parallel: bool = False, workers: Optional[int] = None):
     try:
-        is_valid = blockchain.verify_chain()
+        if parallel:
+            is_valid, first_bad = await run_in_threadpool(blockchain.audit_chain_parallel, workers)
+            return {
+                "success": True,
+                "valid": is_valid,
+                "total_blocks": len(blockchain.chain),
+                "first_invalid_block": first_bad
+            }
+
+        is_valid, rehashed = await run_in_threadpool(blockchain.verify_chain_stats, full, start, end)
         return {
             "success": True,
             "valid": is_valid,
-            "total_blocks": len(blockchain.chain)
+            "total_blocks": len(blockchain.chain),
+            "rehashed_blocks": rehashed,
+            "verified_height": blockchain.verified_height
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/merkle-proof/{block_hash}")
+async def get_merkle_proof(block_hash: str):
+    try:
+        proof = blockchain.get_merkle_proof(block_hash)
+        if not proof:
+            raise HTTPException(status_code=404, detail="Block not found")
+        return {"success": True, "data": proof}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/merkle-root/{batch}")
+async def get_merkle_root(batch: int):
+    try:
+        root, sealed = blockchain.get_merkle_root(batch)
+        if root is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        return {"success": True, "batch": batch, "root": root, "sealed": sealed}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/convert-patient/{patient_id}")
-def convert_patient(patient_id: str):
+async def convert_patient(patient_id: str):
     try:
-        success = blockchain.convert_patient_to_ex_patient(patient_id)
+        success = await run_in_threadpool(blockchain.convert_patient_to_ex_patient, patient_id)
         if success:
             return {"success": True, "message": f"Patient {patient_id} converted to ex-patient"}
         else:
@@ -173,7 +530,7 @@ def convert_patient(patient_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/users")
-def get_all_users():
+async def get_all_users():
     try:
         return {
             "success": True,
@@ -183,6 +540,16 @@ def get_all_users():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+async def get_stats():
+    return {
+        "success": True,
+        "key_cache": WalletManager.key_cache.stats(),
+        "crypto_workers": CRYPTO_WORKERS,
+        "crypto_backend": WalletManager.backend.name,
+        "blobs": blockchain.blobs.stats() if blockchain.blobs else None
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,806 @@
+"""
+Performance benchmarks for the RS MediTrust blockchain
+
+Usage:
+    python benchmark.py <scenario> [options]
+
+Run without arguments to list the available scenarios.
+"""
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
+
+from blockchain import HealthBlockchain, HealthBlock, WalletManager, verify_signature_batch
+from crypto_backends import available_backends, select_backend
+from encoding import ENCODING_VERSION, LEGACY_VERSION
+
+
+def build_chain(total_blocks, patients=1000, blockchain=None):
+    """Build a synthetic chain spread over `patients` patient IDs (in memory only)"""
+    blockchain = blockchain or HealthBlockchain()
+    for i in range(total_blocks):
+        block = HealthBlock(
+            f"P{i % patients:05d}",
+            {"berat": 70, "tinggi": 170, "tensi": "120/80", "visit": i},
+            ("public", "private", "patient")[i % 3],
+            blockchain.get_latest_block().hash,
+            "SYNTHETIC"
+        )
+        blockchain.link_block(block)
+        blockchain.index_block(len(blockchain.chain) - 1, block)
+    return blockchain
+
+
+def timeit(func, repeat=200):
+    """Return mean wall-clock milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def bench_patient_data(*sizes):
+    """get_patient_data latency as the chain grows (records per patient stay fixed)"""
+    sizes = sizes or (10_000, 100_000, 300_000)
+    print(f"{'blocks':>10} {'records/patient':>16} {'ms/call':>10}")
+    for size in sizes:
+        blockchain = build_chain(size, patients=size // 10)
+        blockchain.register_user("komite_medis", {
+            'nama': 'Bench', 'umur': '40', 'no_identitas': 'X',
+            'alamat': 'Jakarta', 'no_telp': '0'
+        })
+        address = next(iter(blockchain.users['komite_medis']))
+        ms = timeit(lambda: blockchain.get_patient_data("P00001", address))
+        print(f"{size:>10} {10:>16} {ms:>10.3f}")
+
+
+def bench_parallel_audit(total_blocks=1_000_000, *worker_counts):
+    """Full-chain audit wall time for 1 vs N worker processes over a persisted store"""
+    worker_counts = worker_counts or (1, 2, 4, os.cpu_count() or 1)
+    directory = tempfile.mkdtemp(prefix="meditrust-bench-")
+    try:
+        writer = build_chain(total_blocks, blockchain=HealthBlockchain(data_dir=directory))
+        for start in range(1, len(writer.chain), 10_000):
+            writer.store.append_many(writer.chain[start:start + 10_000])
+        writer.store.close()
+        writer.events.close()
+        del writer
+        blockchain = HealthBlockchain(data_dir=directory)
+        print(f"{'workers':>8} {'effective':>10} {'seconds':>10} {'blocks/s':>12}")
+        for workers in sorted(set(worker_counts)):
+            start = time.perf_counter()
+            is_valid, _ = blockchain.audit_chain_parallel(workers)
+            elapsed = time.perf_counter() - start
+            assert is_valid
+            effective = min(workers, os.cpu_count() or 1)
+            print(f"{workers:>8} {effective:>10} {elapsed:>10.2f} {total_blocks / elapsed:>12.0f}")
+        blockchain.store.close()
+        blockchain.events.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_startup(total_blocks=1_000_000, users=10_000):
+    """Time to reopen a persisted store, replaying the journal vs loading a snapshot"""
+    directory = tempfile.mkdtemp(prefix="meditrust-bench-")
+    try:
+        blockchain = HealthBlockchain(data_dir=directory)
+        source = build_chain(total_blocks)
+        for start in range(1, len(source.chain), 10_000):
+            blockchain.store.append_many(source.chain[start:start + 10_000])
+        for i in range(users):
+            blockchain.register_user("patient", {
+                'nama': f'Patient {i}', 'umur': '40', 'no_identitas': str(i),
+                'alamat': 'Jakarta', 'no_telp': '0'
+            }, patient_id=f"P{i:05d}", wallet_info={'address': f"ADDR{i}", 'public_key_hex': "04"})
+        blockchain.store.close()
+        blockchain.events.close()
+        size = sum(os.path.getsize(os.path.join(directory, name))
+                   for name in os.listdir(directory) if name.startswith("segment-"))
+
+        start = time.perf_counter()
+        reopened = HealthBlockchain(data_dir=directory)
+        elapsed = time.perf_counter() - start
+        print(f"blocks: {len(reopened.chain) - 1}  users: {len(reopened.user_roles)}  store size: {size / 1e6:.1f} MB")
+        print(f"startup, full index + journal replay: {elapsed:.2f} s")
+
+        start = time.perf_counter()
+        height, snapshot_size = reopened.save_snapshot()
+        print(f"snapshot at height {height}: {snapshot_size / 1e6:.1f} MB in {time.perf_counter() - start:.2f} s")
+        reopened.close()
+
+        start = time.perf_counter()
+        restored = HealthBlockchain(data_dir=directory)
+        elapsed = time.perf_counter() - start
+        assert len(restored.user_roles) == users and len(restored.chain) == len(reopened.chain)
+        print(f"startup from snapshot: {elapsed:.2f} s")
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_hashing(repeat=20_000):
+    """Block hashing throughput, legacy str() concatenation vs canonical encoding"""
+    typical = {"berat": 70, "tinggi": 170, "tensi": "120/80", "diagnosis": "Hipertensi ringan"}
+    large = {
+        "panel": [{"test": f"T{i}", "value": i * 1.5, "unit": "mg/dL", "flags": ["H", "L"]} for i in range(500)],
+        "report": "x" * 20_000
+    }
+    print(f"{'payload':>8} {'encoding':>10} {'hashes/s':>12}")
+    for name, data in (("typical", typical), ("large", large)):
+        block = HealthBlock("P00001", data, "public", "0" * 64, "SYNTHETIC")
+        count = repeat if name == "typical" else repeat // 100
+        for version, label in ((LEGACY_VERSION, "legacy"), (ENCODING_VERSION, "canonical")):
+            block.hash_version = version
+            ms = timeit(block.calculate_hash, count)
+            print(f"{name:>8} {label:>10} {1000 / ms:>12.0f}")
+
+
+def bench_repeat_login(staff=20, rounds=10):
+    """login_with_private_key latency for repeated logins by the same staff"""
+    blockchain = HealthBlockchain()
+    keys = []
+    for i in range(staff):
+        wallet = blockchain.register_user("suster", {
+            'nama': f'Staff {i}', 'umur': '30', 'no_identitas': str(i),
+            'alamat': 'Jakarta', 'no_telp': '0'
+        })
+        keys.append(wallet['private_key_hex'])
+
+    WalletManager.key_cache.clear()
+    cold = timeit(lambda: [blockchain.login_with_private_key(k) for k in keys], 1) / staff
+    warm = timeit(lambda: [blockchain.login_with_private_key(k) for k in keys], rounds) / staff
+    print(f"cold login: {cold:.3f} ms  cached login: {warm:.3f} ms  speedup: {cold / warm:.0f}x")
+    print(f"cache stats: {WalletManager.key_cache.stats()}")
+
+
+def legacy_check_authorization(blockchain, address, access_level, patient_id=None):
+    """check_authorization as it was before AccessPolicy, for comparison"""
+    if address not in blockchain.user_roles:
+        return False
+    role = blockchain.user_roles[address]
+    roles = blockchain.authorized_roles
+    if access_level == 'private':
+        return role in roles['private']
+    if access_level == 'patient':
+        if patient_id and address in blockchain.patient_addresses.get(patient_id, ()):
+            return True
+        return role in roles['private'] + roles['public']
+    return role in roles['private'] + roles['public']
+
+
+def bench_authorization(repeat=200_000):
+    """Authorization checks per second, list concatenation vs compiled AccessPolicy"""
+    blockchain = HealthBlockchain()
+    profile = {'nama': 'Bench', 'umur': '40', 'no_identitas': 'X', 'alamat': 'Jakarta', 'no_telp': '0'}
+    addresses = [blockchain.register_user(role, profile, patient_id="P00001")['address']
+                 for role in ("suster", "direktur", "family")]
+    checks = [(address, level) for address in addresses for level in ("public", "private", "patient")]
+
+    def run(check):
+        for address, level in checks:
+            check(address, level, "P00001")
+
+    legacy = timeit(lambda: run(functools.partial(legacy_check_authorization, blockchain)),
+                    repeat // len(checks))
+    compiled = timeit(lambda: run(blockchain.check_authorization), repeat // len(checks))
+    print(f"legacy:   {len(checks) * 1000 / legacy:>12.0f} checks/s")
+    print(f"compiled: {len(checks) * 1000 / compiled:>12.0f} checks/s")
+
+
+def bench_batch_ingest(total_records=20_000):
+    """Ingestion records/s with add_block vs add_blocks batches of 1, 100 and 10,000"""
+    profile = {'nama': 'Bench', 'umur': '40', 'no_identitas': 'X', 'alamat': 'Jakarta', 'no_telp': '0'}
+    record = {"berat": 70, "tinggi": 170, "tensi": "120/80"}
+    print(f"{'mode':>16} {'records/s':>12}")
+    for batch_size in (None, 1, 100, 10_000):
+        directory = tempfile.mkdtemp(prefix="meditrust-bench-")
+        try:
+            blockchain = HealthBlockchain(data_dir=directory)
+            address = blockchain.register_user("suster", profile)['address']
+            records = [{'patient_id': f"P{i % 1000:05d}", 'data': record,
+                        'access_level': 'public', 'user_address': address}
+                       for i in range(total_records)]
+
+            start = time.perf_counter()
+            if batch_size is None:
+                for item in records:
+                    blockchain.add_block(item['patient_id'], item['data'], 'public', address)
+            else:
+                for offset in range(0, total_records, batch_size):
+                    blockchain.add_blocks(records[offset:offset + batch_size])
+            blockchain.close()
+            elapsed = time.perf_counter() - start
+
+            label = "add_block" if batch_size is None else f"batch of {batch_size}"
+            print(f"{label:>16} {total_records / elapsed:>12.0f}")
+        finally:
+            shutil.rmtree(directory)
+
+
+def stress_concurrent_writes(total_writes=5_000, threads=32):
+    """Concurrent add_block/add_blocks/reads from a thread pool; asserts the chain stays valid"""
+    sys.setswitchinterval(1e-6)  # Force frequent thread switches to expose races
+    blockchain = HealthBlockchain()
+    profile = {'nama': 'Bench', 'umur': '40', 'no_identitas': 'X', 'alamat': 'Jakarta', 'no_telp': '0'}
+    address = blockchain.register_user("komite_medis", profile)['address']
+
+    def write(i):
+        if i % 10 == 0:
+            results = blockchain.add_blocks([{'patient_id': f"P{i % 50:05d}", 'data': {"visit": i},
+                                              'access_level': 'private', 'user_address': address}] * 5)
+            return sum(1 for result in results if result['success'])
+        blockchain.get_patient_data(f"P{i % 50:05d}", address)
+        return 1 if blockchain.add_block(f"P{i % 50:05d}", {"visit": i}, 'public', address) else 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        written = sum(executor.map(write, range(total_writes)))
+    elapsed = time.perf_counter() - start
+
+    previous_hashes = [block.previous_hash for block in blockchain.chain]
+    is_valid = blockchain.verify_chain(full=True)
+    assert written == len(blockchain.chain) - 1, "lost writes"
+    assert len(set(previous_hashes)) == len(previous_hashes), "chain forked"
+    assert is_valid, "chain invalid"
+    print(f"{written} blocks from {threads} threads in {elapsed:.2f} s, chain valid")
+
+
+def load_read_latency(storm_threads=16, seconds=10):
+    """p50/p99 of GET / on a running API (MEDITRUST_URL) during a /register + /access-request/sign storm"""
+    base_url = os.environ.get("MEDITRUST_URL", "http://127.0.0.1:8000")
+
+    def call(path, body=None):
+        request = urllib.request.Request(
+            base_url + path,
+            data=json.dumps(body).encode() if body is not None else None,
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return json.loads(response.read())
+
+    profile = {'umur': '40', 'no_identitas': 'X', 'alamat': 'Jakarta', 'no_telp': '0'}
+    doctor_key = os.urandom(32).hex()
+    doctor = call("/register", dict(profile, role="doc", nama="Bench Doctor", private_key_hex=doctor_key))['data']
+    request_id = call("/access-request", {
+        'patient_id': "P00001", 'requester_address': doctor['address'], 'data_type': "private"
+    })['request_id']
+
+    deadline = time.monotonic() + seconds
+    signing_calls = 0
+
+    def storm(i):
+        nonlocal signing_calls
+        while time.monotonic() < deadline:
+            if i % 2:
+                # A fresh key every time, so derivation is never served from the cache
+                call("/register", dict(profile, role="suster", nama=f"Storm {i}",
+                                       private_key_hex=os.urandom(32).hex()))
+            else:
+                call("/access-request/sign", {'request_id': request_id, 'signer_address': doctor['address'],
+                                              'private_key_hex': doctor_key})
+            signing_calls += 1
+
+    latencies = []
+    with ThreadPoolExecutor(max_workers=storm_threads) as executor:
+        futures = [executor.submit(storm, i) for i in range(storm_threads)]
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            call("/")
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+        for future in futures:
+            future.result()
+
+    latencies.sort()
+    print(f"storm: {signing_calls} crypto requests from {storm_threads} threads in {seconds} s")
+    print(f"GET / over {len(latencies)} calls: p50 {latencies[len(latencies) // 2]:.1f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.1f} ms  max {latencies[-1]:.1f} ms")
+
+
+def bench_signature_verification(total_signatures=10_000, signers=20, workers=os.cpu_count() or 1):
+    """Throughput of bulk access-request signature verification"""
+    blockchain = HealthBlockchain()
+    keys = {}
+    for i in range(signers):
+        role = ("doc", "komite_medis")[i % 2]
+        wallet = blockchain.register_user(role, {
+            'nama': f'Signer {i}', 'umur': '40', 'no_identitas': str(i),
+            'alamat': 'Jakarta', 'no_telp': '0'
+        })
+        keys[wallet['address']] = SigningKey.from_string(bytes.fromhex(wallet['private_key_hex']), curve=SECP256k1)
+
+    addresses = list(keys)
+    items = []
+    for i in range(total_signatures // 2):
+        request_id = blockchain.create_access_request(f"P{i:05d}", addresses[0], "private")
+        request = blockchain.access_requests[request_id]
+        message = request.signing_message().encode()
+        for address in (addresses[i % signers], addresses[(i + 1) % signers]):
+            request.add_signature(address, keys[address].sign(message).hex())
+    # One forged signature must be rejected
+    request.signatures[addresses[0]] = keys[addresses[1]].sign(b"forged").hex()
+
+    for request in blockchain.access_requests.values():
+        items.extend(item for _, item in blockchain.signature_items(request))
+
+    def uncached():
+        for public_key_hex, message, signature_hex in items:
+            vk = VerifyingKey.from_string(bytes.fromhex(public_key_hex[2:]), curve=SECP256k1)
+            try:
+                vk.verify(bytes.fromhex(signature_hex), message.encode())
+            except BadSignatureError:
+                pass
+
+    WalletManager.backend.load_public.cache_clear()
+    timings = [("uncached VerifyingKey", timeit(uncached, 1))]
+    timings.append((f"{WalletManager.backend.name}, cached keys", timeit(lambda: verify_signature_batch(items), 1)))
+    result = None
+    if workers > 1:
+        def parallel():
+            nonlocal result
+            result = blockchain.verify_pending_requests(workers=workers)
+        timings.append((f"bulk, {workers} workers", timeit(parallel, 1)))
+    else:
+        def sequential():
+            nonlocal result
+            result = blockchain.verify_pending_requests(workers=1)
+        timings.append(("bulk, 1 process", timeit(sequential, 1)))
+
+    for label, ms in timings:
+        print(f"{label:<24} {ms / 1000:>7.2f} s  {len(items) / ms * 1000:>8.0f} signatures/s")
+    assert result['rejected'] == 1 and result['approved'] == len(blockchain.access_requests) - 1, result
+    print(f"bulk result: {result}")
+
+
+def bench_crypto_backends(operations=200):
+    """Key derivation / sign / verify ops/sec per installed crypto backend, with cross-checks"""
+    backends = [select_backend(name) for name in available_backends()]
+    private_keys = [os.urandom(32) for _ in range(operations)]
+    message = b"ACCESS-REQUEST-0001P00001" * 2
+    addresses = {}
+    signatures = {}
+
+    print(f"{'backend':<14} {'derive/s':>10} {'sign/s':>10} {'verify/s':>10}")
+    for backend in backends:
+        keys = [backend.load_private(k) for k in private_keys]
+        public_keys = [backend.public_key(k) for k in keys]
+        derive = timeit(lambda: [backend.public_key(backend.load_private(k)) for k in private_keys], 1)
+        sign = timeit(lambda: [backend.sign(k, message) for k in keys], 1)
+        signatures[backend.name] = [backend.sign(k, message) for k in keys]
+        for public_key in public_keys:
+            backend.load_public(public_key)  # verifying keys are cached per signer in practice
+        verify = timeit(lambda: [backend.verify(p, message, sig)
+                                 for p, sig in zip(public_keys, signatures[backend.name])], 1)
+        addresses[backend.name] = [WalletManager.address_from_public_key(p) for p in public_keys]
+        print(f"{backend.name:<14} {operations / derive * 1000:>10.0f} "
+              f"{operations / sign * 1000:>10.0f} {operations / verify * 1000:>10.0f}")
+
+    reference = addresses["ecdsa"]
+    for backend in backends:
+        assert addresses[backend.name] == reference, f"{backend.name} derives different addresses"
+        for signer, sigs in signatures.items():
+            public_keys = [bytes.fromhex(WalletManager.get_public_key_from_private(k.hex())['public_key_hex'])
+                           for k in private_keys[:20]]
+            assert all(backend.verify(p, message, sig) for p, sig in zip(public_keys, sigs)), \
+                f"{backend.name} rejects {signer} signatures"
+            assert not backend.verify(public_keys[0], message + b"x", sigs[0])
+    print(f"addresses identical and signatures interoperable across {[b.name for b in backends]}")
+
+    # The app derives and generates keys in its crypto process pool (/login, /register),
+    # so results must come back from a worker whatever the backend
+    print(f"\n{'app path':<14} {'derive/s':>10} {'generate/s':>10}")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, initializer=use_crypto_backend,
+                                 initargs=(backend.name,)) as pool:
+            hex_keys = [k.hex() for k in private_keys]
+            derived = []
+            derive = timeit(lambda: derived.extend(pool.map(WalletManager.public_key_record, hex_keys)), 1)
+            wallets = []
+            generate = timeit(lambda: wallets.extend(future.result() for future in [
+                pool.submit(WalletManager.generate_wallet_record) for _ in range(operations)]), 1)
+        assert [info['address'] for info in derived] == reference, f"{backend.name} app path derives different addresses"
+        assert all(wallet and 'signing_key' not in wallet for wallet in wallets)
+        print(f"{backend.name:<14} {operations / derive * 1000:>10.0f} {operations / generate * 1000:>10.0f}")
+
+
+def use_crypto_backend(name):
+    """Process pool initializer: switch the worker's WalletManager backend"""
+    WalletManager.backend = select_backend(name)
+
+
+class LegacyHealthBlock:
+    """HealthBlock's former layout: __dict__, datetimes and hex-string hashes"""
+    def __init__(self, block):
+        self.patient_id = block.patient_id
+        self.data = block.data
+        self.access_level = block.access_level
+        self.previous_hash = block.previous_hash
+        self.creator_address = block.creator_address
+        self.timestamp = block.timestamp
+        self.expiry_date = block.expiry_date
+        self.is_expired = False
+        self.hash_version = block.hash_version
+        self.hash = block.hash
+        self.cached_info = None
+
+
+def bench_memory(total_blocks=200_000):
+    """
+    Bytes per block for the former layout (blocks + hash index) vs blocks
+    appended through HealthBlockchain.append_blocks (blocks + all chain indexes)
+    """
+    import tracemalloc
+
+    def payload(i):
+        return {"berat": 70, "tinggi": 170, "tensi": "120/80", "visit": i}
+
+    def new_block(i, previous_hash):
+        return HealthBlock(f"P{i % 1000:05d}", payload(i), ("public", "private", "patient")[i % 3],
+                           previous_hash, "SYNTHETIC")
+
+    def measure_payloads():
+        tracemalloc.start()
+        kept = [(payload(i), f"P{i % 1000:05d}") for i in range(total_blocks)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    def measure_legacy():
+        tracemalloc.start()
+        chain = []
+        heights = {}
+        previous_hash = "0" * 64
+        for i in range(total_blocks):
+            block = LegacyHealthBlock(new_block(i, previous_hash))
+            chain.append(block)
+            heights[block.hash] = i
+            previous_hash = block.hash
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    def measure_appended():
+        tracemalloc.start()
+        blockchain = HealthBlockchain()
+        for start in range(0, total_blocks, 1000):
+            blocks = []
+            previous_hash = blockchain.get_latest_block().hash
+            for i in range(start, min(start + 1000, total_blocks)):
+                block = new_block(i, previous_hash)
+                previous_hash = block.hash
+                blocks.append(block)
+            with blockchain.write_lock:
+                blockchain.append_blocks(blocks)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    payloads = measure_payloads()
+    results = [("former layout", measure_legacy()),
+               ("append_blocks", measure_appended())]
+    print(f"{total_blocks} blocks; data payloads and patient IDs alone: "
+          f"{payloads / total_blocks:.0f} B/block")
+    for label, size in results:
+        print(f"{label:<16} {size / total_blocks:>6.0f} B/block  "
+              f"{size / total_blocks * 1_000_000 / 2**20:>7.0f} MiB per million blocks")
+
+
+def payload_mix(total_records, seed=0):
+    """
+    Synthetic records: mostly small vitals, plus lab panels and imaging reports
+    of several KB, a third of which repeat an earlier report verbatim (e.g. a
+    referral letter attached to several visits)
+    """
+    import random
+    rng = random.Random(seed)
+    tests = ["hemoglobin", "hematokrit", "leukosit", "trombosit", "eritrosit", "gula_darah_puasa",
+             "kolesterol_total", "hdl", "ldl", "trigliserida", "ureum", "kreatinin", "sgot", "sgpt"]
+    reports = []
+    records = []
+    for i in range(total_records):
+        kind = rng.random()
+        if kind < 0.7:
+            records.append({"berat": rng.randint(40, 120), "tinggi": rng.randint(140, 200),
+                            "tensi": f"{rng.randint(90, 160)}/{rng.randint(60, 100)}", "visit": i})
+        elif kind < 0.9 or not reports or rng.random() < 0.67:
+            panel = {"visit": i, "jenis": "laboratorium" if kind < 0.9 else "radiologi", "hasil": [
+                {"tes": test, "nilai": round(rng.uniform(1, 300), 1), "satuan": "mg/dL",
+                 "rujukan": "normal", "catatan": "Hasil dalam batas normal, kontrol ulang 3 bulan"}
+                for test in tests for _ in range(rng.randint(2, 4))
+            ]}
+            if kind >= 0.9:
+                panel["laporan"] = " ".join(rng.choice(tests) for _ in range(1500))
+                reports.append(panel)
+            records.append(panel)
+        else:
+            records.append(rng.choice(reports))
+    return records
+
+
+def bench_payloads(total_records=20_000):
+    """Disk size, resident memory and read latency of inline payloads vs the blob store"""
+    import tracemalloc
+    from blobstore import BlobRef
+
+    records = payload_mix(total_records)
+    training = [json.dumps(r, sort_keys=True, separators=(',', ':')).encode()
+                for r in payload_mix(2000, seed=1) if "hasil" in r]
+
+    def disk_usage(directory):
+        apparent = allocated = 0
+        for root, _, files in os.walk(directory):
+            for name in files:
+                st = os.stat(os.path.join(root, name))
+                apparent += st.st_size
+                allocated += st.st_blocks * 512
+        return apparent, allocated
+
+    print(f"{total_records} records, {sum(1 for r in records if 'hasil' in r)} of them lab/imaging; "
+          f"JSON total {sum(len(json.dumps(r)) for r in records) / 2**20:.1f} MiB")
+    print(f"{'layout':<22} {'disk MiB':>9} {'on-disk MiB':>12} {'memory MiB':>11} "
+          f"{'blobs':>6} {'dedup':>6} {'cold read us':>13} {'warm read us':>13}")
+    for label, threshold, dictionary in (("inline", float('inf'), False),
+                                         ("blob store", None, False),
+                                         ("blob store + dict", None, True)):
+        directory = tempfile.mkdtemp(prefix="meditrust-payloads-")
+        try:
+            blockchain = HealthBlockchain(directory)
+            if threshold:
+                blockchain.BLOB_THRESHOLD = threshold
+            if dictionary:
+                blockchain.blobs.train_dictionary(training)
+            for start in range(0, total_records, 1000):
+                blocks = []
+                previous_hash = blockchain.get_latest_block().hash
+                for data in records[start:start + 1000]:
+                    block = HealthBlock("P00001", blockchain.prepare_payload(data), "public",
+                                        previous_hash, "SYNTHETIC")
+                    previous_hash = block.hash
+                    blocks.append(block)
+                with blockchain.write_lock:
+                    blockchain.append_blocks(blocks)
+            stats = blockchain.blobs.stats()
+            blockchain.close()
+            apparent, allocated = disk_usage(directory)
+
+            tracemalloc.start()
+            reloaded = HealthBlockchain(directory)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            blob_blocks = [block for block in reloaded.chain if isinstance(block.payload, BlobRef)][:500]
+            cold = warm = 0
+            if blob_blocks:
+                start_time = time.perf_counter()
+                for block in blob_blocks:
+                    block.info()
+                cold = (time.perf_counter() - start_time) / len(blob_blocks) * 1e6
+                start_time = time.perf_counter()
+                for block in blob_blocks:
+                    block.info()
+                warm = (time.perf_counter() - start_time) / len(blob_blocks) * 1e6
+            reloaded.close()
+
+            print(f"{label:<22} {apparent / 2**20:>9.1f} {allocated / 2**20:>12.1f} {memory / 2**20:>11.1f} "
+                  f"{stats['written']:>6} {stats['deduplicated']:>6} {cold:>13.0f} {warm:>13.0f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    print(f"blob codec: {stats['codec']}")
+
+
+def bench_projection(records_per_patient=500):
+    """get_patient_data with and without a field projection, for a patient with blob-store payloads"""
+    directory = tempfile.mkdtemp(prefix="meditrust-projection-")
+    try:
+        blockchain = HealthBlockchain(directory)
+        blockchain.register_user("komite_medis", {
+            'nama': 'Bench', 'umur': '40', 'no_identitas': 'X',
+            'alamat': 'Jakarta', 'no_telp': '0'
+        })
+        address = next(iter(blockchain.users['komite_medis']))
+        blockchain.add_blocks([{'patient_id': "P00001", 'data': data, 'access_level': 'public',
+                                'user_address': address} for data in payload_mix(records_per_patient)])
+        blockchain.blobs.cache_bytes = 0  # every payload read goes to disk
+
+        print(f"{records_per_patient} records for one patient, blob cache disabled")
+        print(f"{'fields':<36} {'ms/call':>10} {'KiB/response':>13}")
+        for fields in (None, "data", "data.jenis,timestamp", "timestamp,created_by,block_hash"):
+            ms = timeit(lambda: blockchain.get_patient_data("P00001", address, fields=fields), repeat=10)
+            size = len(json.dumps(blockchain.get_patient_data("P00001", address, fields=fields)))
+            print(f"{fields or '(all)':<36} {ms:>10.2f} {size / 1024:>13.0f}")
+        blockchain.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_query(total_blocks=300_000):
+    """Indexed /query plans vs a full chain scan with the same filters"""
+    from query import Query
+
+    blockchain = HealthBlockchain()
+    creators = [f"DOC{i:03d}" for i in range(200)]
+    diagnoses = [f"ICD-{i:04d}" for i in range(2000)]
+    start_us = blockchain.block_times[0]  # synthetic blocks follow the genesis block
+    for i in range(total_blocks):
+        block = HealthBlock(
+            f"P{i % 10_000:05d}",
+            {"diagnosis": diagnoses[i % len(diagnoses)], "tensi": "120/80", "visit": i},
+            ("public", "private", "patient")[i % 3],
+            blockchain.get_latest_block().hash,
+            creators[i % len(creators)]
+        )
+        block.timestamp_us = start_us + i * 60_000_000  # one block a minute
+        blockchain.link_block(block)
+        blockchain.index_block(len(blockchain.chain) - 1, block)
+    blockchain.register_user("komite_medis", {
+        'nama': 'Bench', 'umur': '40', 'no_identitas': 'X',
+        'alamat': 'Jakarta', 'no_telp': '0'
+    })
+    address = next(iter(blockchain.users['komite_medis']))
+
+    started = time.perf_counter()
+    blockchain.query(address, Query(data={"diagnosis": diagnoses[0]}), limit=1)
+    print(f"{total_blocks} blocks; first diagnosis query builds its index in "
+          f"{time.perf_counter() - started:.2f} s")
+
+    last_day_us = start_us + (total_blocks - 24 * 60) * 60_000_000
+    queries = {
+        "creator": Query(creator_address=creators[7]),
+        "private, last 24 h": Query(access_level="private", since_us=last_day_us),
+        "diagnosis": Query(data={"diagnosis": diagnoses[42]}),
+        "creator + diagnosis": Query(creator_address=creators[7], data={"diagnosis": diagnoses[7]}),
+    }
+    print(f"{'query':<22} {'index':<14} {'candidates':>10} {'results':>8} {'indexed ms':>11} {'scan ms':>9}")
+    for label, query in queries.items():
+        results, _, plan = blockchain.query(address, query, limit=1000)
+        indexed = timeit(lambda: blockchain.query(address, query, limit=1000), repeat=20)
+        scan = timeit(lambda: [block for block in blockchain.chain[1:] if query.matches(block)], repeat=3)
+        print(f"{label:<22} {plan['index']:<14} {plan['candidates']:>10} {len(results):>8} "
+              f"{indexed:>11.2f} {scan:>9.1f}")
+
+
+def bench_time_range(total_blocks=2_000_000, patients=10_000):
+    """Time-window reads through the height/time index vs scanning block timestamps"""
+    blockchain = HealthBlockchain()
+    template = HealthBlock("P00000", {}, "public", "0" * 64, "SYNTHETIC")
+    start_us = blockchain.block_times[0]
+    for i in range(total_blocks):
+        # Cloned from a template: hashing millions of blocks would dominate the setup
+        block = HealthBlock.__new__(HealthBlock)
+        for name in HealthBlock.__slots__:
+            setattr(block, name, getattr(template, name))
+        block.patient_id = f"P{i % patients:05d}"
+        block.payload = {"tensi": "120/80", "visit": i}
+        block.access_level = ("public", "private", "patient")[i % 3]
+        block.digest = i.to_bytes(32, 'big')
+        block.timestamp_us = start_us + i * 15_000_000  # one block every 15 s
+        blockchain.link_block(block)
+        blockchain.index_block(len(blockchain.chain) - 1, block)
+    blockchain.register_user("komite_medis", {
+        'nama': 'Bench', 'umur': '40', 'no_identitas': 'X',
+        'alamat': 'Jakarta', 'no_telp': '0'
+    })
+    address = next(iter(blockchain.users['komite_medis']))
+    end_us = blockchain.block_times[-1] + 1
+    hour = 3_600_000_000
+
+    print(f"{total_blocks} blocks over {total_blocks * 15 / 86400:.0f} days")
+    print(f"{'window':<10} {'blocks':>8} {'bisect us':>10} {'scan ms':>9}")
+    for label, span in (("1 hour", hour), ("1 day", 24 * hour), ("30 days", 720 * hour)):
+        since_us = end_us - span
+        heights = blockchain.height_range(since_us)
+        bisect_us = timeit(lambda: blockchain.height_range(since_us), repeat=10_000) * 1000
+        scan_ms = timeit(lambda: [h for h, block in enumerate(blockchain.chain) if block.timestamp_us >= since_us],
+                         repeat=2)
+        print(f"{label:<10} {len(heights):>8} {bisect_us:>10.2f} {scan_ms:>9.1f}")
+
+    since_us = end_us - 7 * 24 * hour
+    print(f"{'read (last 7 days)':<34} {'results':>8} {'ms/call':>9}")
+    reads = (
+        ("patient-data, whole history", lambda: blockchain.get_patient_data("P00001", address)),
+        ("patient-data, since", lambda: blockchain.get_patient_data("P00001", address, since_us=since_us)),
+        ("chain tail, limit 1000", lambda: blockchain.chain_tail(address, since_us, limit=1000)[0]),
+        ("chain tail, limit 1000, hash only",
+         lambda: blockchain.chain_tail(address, since_us, limit=1000, fields="block_hash")[0]),
+    )
+    for label, read in reads:
+        result = read()
+        count = len(result) if isinstance(result, list) else sum(len(v) for v in result.values())
+        print(f"{label:<34} {count:>8} {timeit(read, repeat=50):>9.3f}")
+
+
+def bench_change_feed(subscribers=200, writes=2_000, records_per_patient=50):
+    """Change-feed delivery latency, and the cost of a feed update vs re-polling patient data"""
+    import asyncio
+    import threading
+
+    blockchain = HealthBlockchain()
+    profile = {'nama': 'Bench', 'umur': '40', 'no_identitas': 'X', 'alamat': 'Jakarta', 'no_telp': '0'}
+    address = blockchain.register_user("komite_medis", profile)['address']
+    patients = [f"P{i:05d}" for i in range(subscribers)]
+    blockchain.add_blocks([{'patient_id': patient_id, 'data': {"visit": i}, 'access_level': 'public',
+                            'user_address': address}
+                           for i in range(records_per_patient) for patient_id in patients])
+
+    sent = {}  # {height: perf_counter before add_block}
+    latencies = []
+
+    async def subscriber(patient_id, expected):
+        received = 0
+        async for event in blockchain.feed.listen(keepalive=5):
+            if event is None:
+                break
+            view = blockchain.feed_view(address, event, patient_id)
+            if view is not None:
+                latencies.append(time.perf_counter() - sent[view['height']])
+                received += 1
+                if received == expected:
+                    break
+
+    def writer(ready):
+        ready.wait()
+        for i in range(writes):
+            sent[len(blockchain.chain)] = time.perf_counter()
+            blockchain.add_block(patients[i % subscribers], {"visit": i}, 'public', address)
+            time.sleep(0.001)
+
+    async def run():
+        ready = threading.Event()
+        tasks = [asyncio.create_task(subscriber(patient_id, writes // subscribers)) for patient_id in patients]
+        thread = threading.Thread(target=writer, args=(ready,))
+        thread.start()
+        await asyncio.sleep(0.1)  # let every subscriber start listening
+        ready.set()
+        await asyncio.gather(*tasks)
+        thread.join()
+
+    asyncio.run(run())
+    latencies.sort()
+    print(f"{subscribers} subscribers, one patient each; {writes} blocks written ~1 ms apart")
+    print(f"delivery latency: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms ({len(latencies)} deliveries)")
+
+    event = blockchain.feed.events[-1]
+    feed_ms = timeit(lambda: blockchain.feed_view(address, event, event[2]), repeat=10_000)
+    poll_ms = timeit(lambda: json.dumps(blockchain.get_patient_data(event[2], address)), repeat=1_000)
+    print(f"per update: feed event {feed_ms * 1000:.1f} us vs re-polling "
+          f"{records_per_patient + writes // subscribers} records {poll_ms * 1000:.1f} us")
+
+
+SCENARIOS = {
+    'patient-data': bench_patient_data,
+    'parallel-audit': bench_parallel_audit,
+    'startup': bench_startup,
+    'hashing': bench_hashing,
+    'login': bench_repeat_login,
+    'authorization': bench_authorization,
+    'batch-ingest': bench_batch_ingest,
+    'stress': stress_concurrent_writes,
+    'read-latency': load_read_latency,
+    'signatures': bench_signature_verification,
+    'crypto-backends': bench_crypto_backends,
+    'memory': bench_memory,
+    'payloads': bench_payloads,
+    'projection': bench_projection,
+    'query': bench_query,
+    'time-range': bench_time_range,
+    'change-feed': bench_change_feed,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in SCENARIOS:
+        print("Available scenarios:")
+        for name, func in SCENARIOS.items():
+            print(f"  {name:<16} {func.__doc__}")
+        sys.exit(1)
+    SCENARIOS[sys.argv[1]](*[int(arg) for arg in sys.argv[2:]])
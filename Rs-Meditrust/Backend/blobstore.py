@@ -0,0 +1,211 @@
+"""
+Content-addressed store for large block payloads
+
+Payloads are addressed by sha256 of their canonical JSON, so identical
+payloads are stored once. Each blob is a file <dir>/<2 hex>/<62 hex> holding
+
+    codec        u8    0 = none, 1 = zlib, 2 = zstd
+    dictionary   4s    id of the compression dictionary, or 4 zero bytes
+    content      compressed canonical JSON
+
+zstd is used when the zstandard package is installed, zlib otherwise; the
+codec is recorded per blob so either can read what the other wrote.
+Dictionaries trained on typical records (train_dictionary) live in
+<dir>/dictionaries/ and are loaded on demand.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+HEADER = struct.Struct('>B4s')
+NO_DICTIONARY = b'\x00' * 4
+
+
+class BlobRef:
+    """A payload held in a BlobStore, loaded when the block's data is read"""
+    __slots__ = ('store', 'digest')
+
+    def __init__(self, store, digest):
+        self.store = store
+        self.digest = digest
+
+    def load(self):
+        return self.store.get_json(self.digest)
+
+    def __reduce__(self):
+        # Worker processes (e.g. chain audits) only need the digest
+        return BlobRef, (None, self.digest)
+
+
+class BlobStore:
+    def __init__(self, directory, level=6, cache_bytes=16 * 1024 * 1024):
+        """
+        Args:
+            directory: Root directory of the blob files
+            level: Compression level
+            cache_bytes: Budget of the LRU cache of decompressed payloads
+        """
+        self.directory = directory
+        self.level = level
+        self.codec = CODEC_ZSTD if zstandard else CODEC_ZLIB
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()  # {digest: content} most recently read last
+        self.cached_bytes = 0
+        self.known = set()  # digests known to be on disk
+        self.dictionaries = {}  # {dictionary id: bytes}
+        self.dictionary_id = NO_DICTIONARY  # dictionary used for new blobs
+        self.lock = threading.Lock()
+        self.stats_counters = {'written': 0, 'deduplicated': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+        os.makedirs(os.path.join(directory, "dictionaries"), exist_ok=True)
+
+        active = os.path.join(directory, "dictionaries", "ACTIVE")
+        if os.path.exists(active):
+            with open(active) as f:
+                self.dictionary_id = bytes.fromhex(f.read().strip())
+
+    def path(self, digest):
+        name = digest.hex()
+        return os.path.join(self.directory, name[:2], name[2:])
+
+    def put(self, content):
+        """
+        Store canonical JSON bytes and return their sha256 digest
+
+        A payload already in the store is not written again. New blobs are
+        fsynced before put() returns, so a block referencing them is never
+        durable without its payload.
+        """
+        digest = hashlib.sha256(content).digest()
+        path = self.path(digest)
+        if digest in self.known or os.path.exists(path):
+            with self.lock:
+                self.known.add(digest)
+                self.stats_counters['deduplicated'] += 1
+            return digest
+
+        stored = HEADER.pack(self.codec, self.dictionary_id) + self.compress(content, self.dictionary_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(stored)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+        with self.lock:
+            self.known.add(digest)
+            self.stats_counters['written'] += 1
+            self.stats_counters['raw_bytes'] += len(content)
+            self.stats_counters['stored_bytes'] += len(stored)
+        return digest
+
+    def get(self, digest):
+        """Decompressed content of a blob, checked against its digest"""
+        with self.lock:
+            content = self.cache.get(digest)
+            if content is not None:
+                self.cache.move_to_end(digest)
+                return content
+
+        with open(self.path(digest), 'rb') as f:
+            stored = f.read()
+        codec, dictionary_id = HEADER.unpack_from(stored)
+        content = self.decompress(stored[HEADER.size:], codec, dictionary_id)
+        if hashlib.sha256(content).digest() != digest:
+            raise ValueError(f"Blob {digest.hex()} is corrupted")
+
+        if len(content) <= self.cache_bytes:
+            with self.lock:
+                self.cache[digest] = content
+                self.cached_bytes += len(content)
+                while self.cached_bytes > self.cache_bytes:
+                    _, evicted = self.cache.popitem(last=False)
+                    self.cached_bytes -= len(evicted)
+        return content
+
+    def get_json(self, digest):
+        return json.loads(self.get(digest))
+
+    def compress(self, content, dictionary_id):
+        dictionary = self.dictionary(dictionary_id)
+        if self.codec == CODEC_ZSTD:
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=self.level, dict_data=dict_data).compress(content)
+        compressor = zlib.compressobj(self.level, zdict=dictionary) if dictionary else zlib.compressobj(self.level)
+        return compressor.compress(content) + compressor.flush()
+
+    def decompress(self, data, codec, dictionary_id):
+        dictionary = self.dictionary(dictionary_id)
+        if codec == CODEC_NONE:
+            return data
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Blob was written with zstd; install the zstandard package to read it")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def dictionary(self, dictionary_id):
+        if dictionary_id == NO_DICTIONARY:
+            return None
+        dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary is None:
+            with open(os.path.join(self.directory, "dictionaries", dictionary_id.hex()), 'rb') as f:
+                dictionary = f.read()
+            self.dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def train_dictionary(self, samples, size=32 * 1024):
+        """
+        Build a compression dictionary from typical payloads and use it for new blobs
+
+        With zstd the dictionary is trained by zstandard. zlib has no trainer,
+        so its preset dictionary is the samples themselves, most recent last
+        (zlib favours matches near the end of the window).
+
+        Args:
+            samples: List of canonical JSON bytes of typical records
+            size: Dictionary size in bytes
+
+        Returns:
+            Hex id of the new dictionary
+        """
+        if self.codec == CODEC_ZSTD:
+            dictionary = zstandard.train_dictionary(size, samples).as_bytes()
+        else:
+            dictionary = b''.join(samples)[-size:]
+        dictionary_id = hashlib.sha256(dictionary).digest()[:4]
+
+        directory = os.path.join(self.directory, "dictionaries")
+        with open(os.path.join(directory, dictionary_id.hex()), 'wb') as f:
+            f.write(dictionary)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(os.path.join(directory, "ACTIVE.tmp"), 'w') as f:
+            f.write(dictionary_id.hex())
+        os.replace(os.path.join(directory, "ACTIVE.tmp"), os.path.join(directory, "ACTIVE"))
+
+        self.dictionaries[dictionary_id] = dictionary
+        self.dictionary_id = dictionary_id
+        return dictionary_id.hex()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.stats_counters, codec=('none', 'zlib', 'zstd')[self.codec],
+                        dictionary=self.dictionary_id.hex() if self.dictionary_id != NO_DICTIONARY else None,
+                        cached_bytes=self.cached_bytes)
+
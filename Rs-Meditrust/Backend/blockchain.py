@@ -1,37 +1,168 @@
+import bisect
+from array import array
 import hashlib
+import hmac
+import itertools
 import datetime
+import gc
 from dateutil.relativedelta import relativedelta
-from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
 import base58
+import heapq
 import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from Crypto.Hash import RIPEMD160
+from storage import BlockStore, EventLog, read_snapshot, write_snapshot
+from blobstore import BlobRef, BlobStore
+from changefeed import ChangeFeed
+from crypto_backends import select_backend
+from encoding import (BLOB_VERSION, ENCODING_VERSION, LEGACY_VERSION, canonical_json, encode_block,
+                      to_micros, from_micros)
+from query import BlockIndex, Query
+from merkle import merkle_root, merkle_proof
+
+class KeyDerivationCache:
+    """
+    Bounded, TTL-evicting cache of public keys/addresses derived from private keys
+
+    Entries are keyed by an HMAC of the private key under a per-process
+    secret, so the raw private key is never stored.
+    """
+    def __init__(self, maxsize=1024, ttl=900):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.secret = os.urandom(32)
+        self.entries = OrderedDict()  # {hmac_digest: (expires_at, derived_info)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cache_key(self, private_key_hex):
+        return hmac.new(self.secret, private_key_hex.lower().encode(), hashlib.sha256).digest()
+
+    def get(self, private_key_hex):
+        key = self.cache_key(private_key_hex)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry:
+                del self.entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, private_key_hex, derived_info):
+        key = self.cache_key(private_key_hex)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, dict(derived_info))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class BlockViewCache:
+    """
+    Bounded LRU cache of formatted block read views, keyed by block digest
+
+    Only recently read blocks hold a view, so the chain itself stays compact.
+    Blob-store payloads are never part of a cached view.
+    """
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # {digest: view} most recently read last
+        self.lock = threading.Lock()
+
+    def get(self, block):
+        key = block.digest
+        with self.lock:
+            view = self.entries.get(key)
+            if view is not None:
+                self.entries.move_to_end(key)
+                return view
+        view = block.base_info()
+        with self.lock:
+            self.entries[key] = view
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return view
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def verify_signature_batch(items):
+    """
+    Verify many signatures
+
+    Args:
+        items: List of (public_key_hex, message, signature_hex)
+
+    Returns:
+        List of bools in the same order
+    """
+    return [WalletManager.verify_signature(*item) for item in items]
+
 
 class WalletManager:
     """Manages wallet generation and verification"""
 
+    key_cache = KeyDerivationCache()
+    backend = select_backend()  # secp256k1 implementation, see crypto_backends
+
+    @staticmethod
+    def address_from_public_key(public_key_uncompressed):
+        """Base58Check address of an uncompressed public key"""
+        sha256_pk = hashlib.sha256(public_key_uncompressed).digest()
+        ripemd160 = RIPEMD160.new()
+        ripemd160.update(sha256_pk)
+        hashed_pk = ripemd160.digest()
+
+        versioned_payload = b'\x00' + hashed_pk
+        checksum = hashlib.sha256(hashlib.sha256(versioned_payload).digest()).digest()[:4]
+        address_bytes = versioned_payload + checksum
+        return base58.b58encode(address_bytes).decode()
+
     @staticmethod
     def generate_wallet():
         """Generate new wallet with private key, public key, and address"""
         try:
-            sk = SigningKey.generate(curve=SECP256k1)
-            private_key_bytes = sk.to_string()
+            backend = WalletManager.backend
+            private_key_bytes = backend.generate()
             private_key_hex = private_key_bytes.hex()
 
-            vk = sk.get_verifying_key()
-            public_key_bytes = vk.to_string()
-            public_key_uncompressed = b'\x04' + public_key_bytes
+            sk = backend.load_private(private_key_bytes)
+            public_key_uncompressed = backend.public_key(sk)
             public_key_hex = public_key_uncompressed.hex()
 
             # Generate address from public key
-            sha256_pk = hashlib.sha256(public_key_uncompressed).digest()
-            ripemd160 = RIPEMD160.new()
-            ripemd160.update(sha256_pk)
-            hashed_pk = ripemd160.digest()
-
-            versioned_payload = b'\x00' + hashed_pk
-            checksum = hashlib.sha256(hashlib.sha256(versioned_payload).digest()).digest()[:4]
-            address_bytes = versioned_payload + checksum
-            address = base58.b58encode(address_bytes).decode()
+            address = WalletManager.address_from_public_key(public_key_uncompressed)
 
             return {
                 "private_key_hex": private_key_hex,
@@ -43,6 +174,14 @@ class WalletManager:
             print(f"Error generating wallet: {e}")
             return None
 
+    @staticmethod
+    def generate_wallet_record():
+        """generate_wallet without the signing key object, safe to return from a worker process"""
+        wallet_info = WalletManager.generate_wallet()
+        if wallet_info:
+            wallet_info.pop("signing_key")
+        return wallet_info
+
     @staticmethod
     def get_public_key_from_private(private_key_hex):
         """Recover public key and address from private key"""
@@ -51,22 +190,11 @@ class WalletManager:
                 raise ValueError("Private key must be 64 hexadecimal characters")
 
             private_key_bytes = bytes.fromhex(private_key_hex)
-            sk = SigningKey.from_string(private_key_bytes, curve=SECP256k1)
+            sk = WalletManager.backend.load_private(private_key_bytes)
 
-            vk = sk.get_verifying_key()
-            public_key_bytes = vk.to_string()
-            public_key_uncompressed = b'\x04' + public_key_bytes
+            public_key_uncompressed = WalletManager.backend.public_key(sk)
             public_key_hex = public_key_uncompressed.hex()
-
-            sha256_pk = hashlib.sha256(public_key_uncompressed).digest()
-            ripemd160 = RIPEMD160.new()
-            ripemd160.update(sha256_pk)
-            hashed_pk = ripemd160.digest()
-
-            versioned_payload = b'\x00' + hashed_pk
-            checksum = hashlib.sha256(hashlib.sha256(versioned_payload).digest()).digest()[:4]
-            address_bytes = versioned_payload + checksum
-            address = base58.b58encode(address_bytes).decode()
+            address = WalletManager.address_from_public_key(public_key_uncompressed)
 
             return {
                 "public_key_hex": public_key_hex,
@@ -80,13 +208,39 @@ class WalletManager:
             print(f"Error recovering keys: {e}")
             return None
 
+    @staticmethod
+    def public_key_record(private_key_hex):
+        """get_public_key_from_private without the signing key object, safe to return from a worker process"""
+        wallet_info = WalletManager.get_public_key_from_private(private_key_hex)
+        if wallet_info:
+            wallet_info.pop("signing_key")
+        return wallet_info
+
+    @staticmethod
+    def derive_public_info(private_key_hex):
+        """Cached public key and address for a private key (no signing key)"""
+        cached = WalletManager.key_cache.get(private_key_hex)
+        if cached:
+            return cached
+
+        wallet_info = WalletManager.get_public_key_from_private(private_key_hex)
+        if not wallet_info:
+            return None
+
+        derived_info = {
+            "public_key_hex": wallet_info["public_key_hex"],
+            "address": wallet_info["address"]
+        }
+        WalletManager.key_cache.put(private_key_hex, derived_info)
+        return derived_info
+
     @staticmethod
     def sign_message(private_key_hex, message):
         """Sign a message with private key"""
         try:
             private_key_bytes = bytes.fromhex(private_key_hex)
-            sk = SigningKey.from_string(private_key_bytes, curve=SECP256k1)
-            signature = sk.sign(message.encode())
+            sk = WalletManager.backend.load_private(private_key_bytes)
+            signature = WalletManager.backend.sign(sk, message.encode())
             return signature.hex()
         except Exception as e:
             print(f"Error signing message: {e}")
@@ -96,13 +250,9 @@ class WalletManager:
     def verify_signature(public_key_hex, message, signature_hex):
         """Verify a signature"""
         try:
-            public_key_bytes = bytes.fromhex(public_key_hex[2:])  # Remove '04' prefix
-            vk = VerifyingKey.from_string(public_key_bytes, curve=SECP256k1)
+            public_key_bytes = bytes.fromhex(public_key_hex)
             signature = bytes.fromhex(signature_hex)
-            vk.verify(signature, message.encode())
-            return True
-        except BadSignatureError:
-            return False
+            return WalletManager.backend.verify(public_key_bytes, message.encode(), signature)
         except Exception as e:
             print(f"Error verifying signature: {e}")
             return False
@@ -130,68 +280,407 @@ class UserProfile:
             "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S")
         }
 
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a profile from vars() of one (snapshots and journal replay)"""
+        profile = cls.__new__(cls)
+        profile.__dict__.update(state)
+        return profile
+
 
 class AccessRequest:
     """Manage multi-signature access requests"""
-    def __init__(self, request_id, patient_id, requester_address, data_type):
+    def __init__(self, request_id, patient_id, requester_address, data_type, ttl=None):
         self.request_id = request_id
         self.patient_id = patient_id
         self.requester_address = requester_address
         self.data_type = data_type  # 'private' or 'patient'
         self.signatures = {}  # {address: signature}
+        self.verified_signers = set()  # addresses whose signature passed verification
         self.created_at = datetime.datetime.now()
+        self.expires_at = self.created_at + ttl if ttl else None  # pending requests are purged after this
         self.status = "pending"  # pending, approved, rejected
         self.required_signatures = 2  # Need doctor + komite_medis
+        self.seq = None  # creation order, assigned when the chain indexes the request
 
     def add_signature(self, address, signature):
-        """Add a signature to the request"""
+        """
+        Add a signature to the request
+
+        The request is only approved once enough signatures have been
+        verified (see HealthBlockchain.verify_access_request).
+        """
         self.signatures[address] = signature
-        if len(self.signatures) >= self.required_signatures:
+        self.verified_signers.discard(address)
+        return len(self.signatures) >= self.required_signatures
+
+    def mark_verified(self, checked, valid_signers):
+        """
+        Record verification results and approve once enough signatures are valid
+
+        Args:
+            checked: {address: signature} that was verified
+            valid_signers: Addresses from checked whose signature is valid
+        """
+        for address, signature in checked.items():
+            if self.signatures.get(address) != signature:
+                continue  # Re-signed since the check; the new signature is still unverified
+            if address in valid_signers:
+                self.verified_signers.add(address)
+            else:
+                del self.signatures[address]
+        if len(self.verified_signers) >= self.required_signatures:
             self.status = "approved"
 
+    def is_expired(self, now=None):
+        """Pending requests stop being signable once their TTL has passed"""
+        return (self.status == "pending" and self.expires_at is not None
+                and self.expires_at <= (now or datetime.datetime.now()))
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "patient_id": self.patient_id,
+            "requester_address": self.requester_address,
+            "data_type": self.data_type,
+            "status": self.status,
+            "signers": list(self.signatures),
+            "required_signatures": self.required_signatures,
+            "created_at": self.created_at.isoformat(),
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a request from vars() of one (snapshots and journal replay)"""
+        request = cls.__new__(cls)
+        request.__dict__.update(state)
+        return request
+
     def is_approved(self):
         return self.status == "approved"
 
+    def signing_message(self):
+        """Message that doctor/komite_medis sign to approve the request"""
+        return f"{self.request_id}{self.patient_id}{self.requester_address}"
+
+
+class AccessPolicy:
+    """
+    Permission table compiled once from authorized_roles
+
+    Maps (role, access_level) to write and read permissions using frozensets.
+    Rebuild it (HealthBlockchain.set_authorized_roles) whenever roles change.
+    """
+    def __init__(self, authorized_roles):
+        self.private_roles = frozenset(authorized_roles['private'])
+        self.public_roles = frozenset(authorized_roles['public'])
+        self.patient_roles = frozenset(authorized_roles['patient'])
+        self.staff_roles = self.private_roles | self.public_roles
+
+        # Roles allowed without a patient link or multi-signature approval
+        self.write_roles = {'private': self.private_roles}
+        self.read_roles = {
+            'public': self.public_roles,
+            'private': self.private_roles,
+            'patient': self.staff_roles
+        }
+
+    def can_write(self, role, access_level, is_linked=False):
+        """Whether role may add a block at access_level"""
+        if access_level == 'patient' and is_linked:
+            return True
+        return role in self.write_roles.get(access_level, self.staff_roles)
+
+    def can_read(self, role, access_level, is_linked=False, multisig_approved=False):
+        """Whether role may read a block at access_level"""
+        if role in self.read_roles.get(access_level, ()):
+            return True
+        if access_level == 'private':
+            return multisig_approved
+        if access_level == 'patient':
+            return is_linked
+        return False
+
+    def can_access_private(self, role):
+        return role in self.private_roles
+
 
 class HealthBlock:
+    """
+    One block of the chain, kept compact for chains of millions of blocks
+
+    Hashes are held as raw 32-byte digests and times as integer microseconds
+    since the epoch; the hex `hash`/`previous_hash` and datetime
+    `timestamp`/`expiry_date` views are derived on access. Large payloads may
+    be a BlobRef into the blob store, read on demand through `data`.
+    """
+    __slots__ = ('patient_id', 'payload', 'access_level', 'previous_digest', 'creator_address',
+                 'timestamp_us', 'expiry_us', 'is_expired', 'hash_version', 'digest')
+
     def __init__(self, patient_id, data, access_level, previous_hash, creator_address, expiry_years=5):
         self.patient_id = patient_id
-        self.data = data
+        self.payload = data  # data dict, or a BlobRef for payloads kept in the blob store
         self.access_level = access_level
-        self.previous_hash = previous_hash
+        self.previous_digest = pack_hash(previous_hash)
         self.creator_address = creator_address
-        self.timestamp = datetime.datetime.now()
-        self.expiry_date = self.timestamp + relativedelta(years=expiry_years)
+        timestamp = datetime.datetime.now()
+        self.timestamp_us = to_micros(timestamp)
+        self.expiry_us = to_micros(timestamp + relativedelta(years=expiry_years))
         self.is_expired = False
-        self.hash = self.calculate_hash()
+        self.hash_version = BLOB_VERSION if isinstance(data, BlobRef) else ENCODING_VERSION
+        self.digest = self.calculate_digest()
+
+    @property
+    def hash(self):
+        return self.digest.hex()
+
+    @property
+    def previous_hash(self):
+        previous = self.previous_digest
+        return previous.hex() if isinstance(previous, bytes) else previous
+
+    @property
+    def data(self):
+        payload = self.payload
+        return payload.load() if isinstance(payload, BlobRef) else payload
+
+    @property
+    def timestamp(self):
+        return from_micros(self.timestamp_us)
+
+    @property
+    def expiry_date(self):
+        return from_micros(self.expiry_us)
+
+    def calculate_digest(self):
+        if self.hash_version == LEGACY_VERSION:
+            block_string = (str(self.patient_id) + str(self.data) +
+                           str(self.timestamp) + str(self.previous_hash) +
+                           str(self.creator_address) + str(self.expiry_date))
+            return hashlib.sha256(block_string.encode()).digest()
+        return hashlib.sha256(encode_block(self, self.hash_version)).digest()
 
     def calculate_hash(self):
-        block_string = (str(self.patient_id) + str(self.data) +
-                       str(self.timestamp) + str(self.previous_hash) +
-                       str(self.creator_address) + str(self.expiry_date))
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        return self.calculate_digest().hex()
+
+    def base_info(self):
+        """Formatted read view without blob-store payloads (data is None for those)"""
+        return {
+            'data': None if isinstance(self.payload, BlobRef) else self.payload,
+            'timestamp': self.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            'created_by': self.creator_address,
+            'expiry_date': self.expiry_date.strftime("%Y-%m-%d"),
+            'block_hash': self.hash
+        }
+
+    def info(self, views=None):
+        """
+        Formatted read view of the block
+
+        Args:
+            views: BlockViewCache to take the view from; without it the view is
+                   built per call. Blob-store payloads are loaded per call either
+                   way, so they only occupy memory while being read (and in the
+                   blob cache).
+        """
+        info = views.get(self) if views is not None else self.base_info()
+        if isinstance(self.payload, BlobRef):
+            return dict(info, data=self.payload.load())
+        return info
 
     def check_expiry(self):
         """Check if block has expired (5 years)"""
-        if datetime.datetime.now() >= self.expiry_date:
+        if to_micros(datetime.datetime.now()) >= self.expiry_us:
             self.is_expired = True
         return self.is_expired
 
+    @classmethod
+    def from_record(cls, record, blobs=None):
+        """
+        Rebuild a stored block without recomputing its hash
+
+        Args:
+            record: Field dict from decode_records
+            blobs: BlobStore holding the payloads of blob-store blocks
+        """
+        block = cls.__new__(cls)
+        block.patient_id = record['patient_id']
+        if record['hash_version'] >= BLOB_VERSION:
+            block.payload = BlobRef(blobs, record['payload_digest'])
+        else:
+            block.payload = record['data']
+        block.access_level = record['access_level']
+        block.previous_digest = pack_hash(record['previous_hash'])
+        block.creator_address = record['creator_address']
+        block.timestamp_us = record['timestamp_us']
+        block.expiry_us = record['expiry_us']
+        block.is_expired = False
+        block.hash_version = record['hash_version']
+        block.digest = record['digest']
+        return block
+
+
+def pack_hash(value):
+    """Raw digest for a 64-char hex hash; other values (the genesis "0") are kept as-is"""
+    if len(value) == 64:
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            pass
+    return value
+
+
+def public_wallet_info(wallet_info):
+    """Wallet info without key material, as kept in memory, the journal and snapshots"""
+    return {k: v for k, v in wallet_info.items() if k not in ('private_key_hex', 'signing_key')}
+
+
+def verify_segment(offset, blocks, previous_hash):
+    """
+    Verify a contiguous slice of the chain
+
+    Args:
+        offset: Chain index of the first block in the slice
+        blocks: List of HealthBlock
+        previous_hash: Stored hash of the block preceding the slice
+
+    Returns:
+        Chain index of the first invalid block, or None
+    """
+    previous_digest = pack_hash(previous_hash)
+    for i, block in enumerate(blocks):
+        if block.digest != block.calculate_digest() or block.previous_digest != previous_digest:
+            return offset + i
+        previous_digest = block.digest
+    return None
+
+
+def _verify_stored_segment_task(args):
+    """
+    Verify a slice of the chain read straight from the block store
+
+    Args:
+        args: (store directory, BlockStore.runs() of the slice, chain index of
+              its first block, stored hash of the block preceding it)
+    """
+    directory, runs, offset, previous_hash = args
+    try:
+        blocks = [
+            HealthBlock.from_record(record)
+            for number, start, count in runs
+            for record in BlockStore.read_run(directory, number, start, count)
+        ]
+    except Exception as e:
+        print(f"Error reading segment at block {offset}: {e}")
+        return offset
+    return verify_segment(offset, blocks, previous_hash)
+
+
+METADATA_FIELDS = ('timestamp', 'created_by', 'created_by_name', 'expiry_date', 'block_hash')
+
+
+def parse_fields(fields):
+    """
+    Parse a patient-data projection
+
+    Args:
+        fields: Comma-separated string or list of metadata columns (see
+                METADATA_FIELDS), "data" for the whole payload and
+                "data.<key>" for single payload keys
+
+    Returns:
+        (columns, data_keys): metadata columns in METADATA_FIELDS order, and
+        None for the whole payload, a tuple of keys, or () for no payload
+
+    Raises:
+        ValueError: On an unknown field
+    """
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    columns = set()
+    data_keys = []
+    whole_data = False
+    for field in fields:
+        field = field.strip()
+        if field == 'data':
+            whole_data = True
+        elif field.startswith('data.') and len(field) > 5:
+            data_keys.append(field[5:])
+        elif field in METADATA_FIELDS:
+            columns.add(field)
+        elif field:
+            raise ValueError(f"Unknown field '{field}'")
+    return (tuple(c for c in METADATA_FIELDS if c in columns),
+            None if whole_data else tuple(dict.fromkeys(data_keys)))
+
 
 class HealthBlockchain:
-    def __init__(self):
-        self.chain = [self.create_genesis_block()]
+    MERKLE_BATCH_SIZE = 1024  # Blocks per Merkle tree; a full batch is sealed
+    ACCESS_REQUEST_TTL = datetime.timedelta(days=7)  # Pending access requests are purged after this
+    BLOB_THRESHOLD = 4096  # Payloads of at least this many bytes of JSON go to the blob store
+    INDEXED_DATA_KEYS = ('diagnosis', 'penyakit_khusus', 'goldar', 'alergi')  # Queryable by value
+    FEED_SIZE = 10000  # Recent change-feed events kept for resuming subscribers
+    QUERY_LIMIT = 1000  # Most results one query() page returns
+
+    def __init__(self, data_dir=None):
+        """
+        Args:
+            data_dir: Optional directory for the persistent block store, event
+                      journal, snapshots and payload blobs. Without it everything
+                      lives in memory only.
+        """
+        self.chain = []
         self.users = {}  # {role: {address: wallet_info}}
         self.user_roles = {}  # {address: role}
         self.user_profiles = {}  # {address: UserProfile}
-        self.patient_addresses = {}  # {patient_id: [addresses]}
+        self.patient_addresses = {}  # {patient_id: {addresses}}
+        self.address_patients = {}  # {address: patient_id}
+        self.creator_names = {}  # {address: display name} cache for block views
+        self.block_views = BlockViewCache()  # formatted views of recently read blocks
         self.patient_status = {}  # {patient_id: 'active' or 'ex-patient'}
         self.access_requests = {}  # {request_id: AccessRequest}
+        self.request_seq = 0  # seq of the most recently created access request
+        self.requests_by_patient = {}  # {patient_id: {request_id: AccessRequest}} in creation order
+        self.requests_by_requester = {}  # {address: {request_id: AccessRequest}} in creation order
+        self.requests_by_status = {'pending': {}, 'approved': {}}  # {status: {request_id: AccessRequest}}
+        self.request_expiry_heap = []  # [(expires_at, request_id)] for pending requests
+        self.patient_blocks = {}  # {patient_id: {'all': [heights], access_level: [heights]}}
+        self.expiry_heap = []  # [(expiry_us, height)] for blocks not yet marked expired
+        self.block_heights = {}  # {block digest: height}
+        self.block_times = array('q')  # creation time (epoch us) by height, clamped to never decrease
+        self.block_index = BlockIndex(self.INDEXED_DATA_KEYS)  # creator, access level and payload-key indexes
+        self.merkle_roots = {}  # {batch_number: root} for sealed batches, filled on demand
+        self.verified_height = 0  # Highest block index verified by verify_chain
+        self.verified_tip_hash = None  # Digest of the block at verified_height
+        self.write_lock = threading.RLock()  # Single writer for chain appends and state changes
+        self.verify_lock = threading.Lock()  # Guards the verification checkpoint
+        self.snapshot_lock = threading.Lock()  # One snapshot write at a time
+        self.event_seq = 0  # Sequence number of the last journaled state change
+        self.replaying = False  # True while replaying the journal, so events are not journaled twice
+        self.last_expiry_sweep = None  # Time of the last clean_expired_blocks sweep
+        self.feed = ChangeFeed(self.FEED_SIZE)  # New blocks, conversions and access-request signatures
         self.authorized_roles = {
             'private': ['komite_medis', 'direktur'],
             'public': ['suster', 'doc', 'komite_medis', 'direktur'],
             'patient': ['patient', 'ex-patient', 'family']
         }
+        self.policy = AccessPolicy(self.authorized_roles)
+
+        self.store = BlockStore(data_dir) if data_dir else None
+        self.events = EventLog(os.path.join(data_dir, "events")) if data_dir else None
+        self.snapshot_path = os.path.join(data_dir, "snapshot.bin") if data_dir else None
+        self.blobs = BlobStore(os.path.join(data_dir, "blobs")) if data_dir else None
+        if self.store:
+            self.load_state()
+
+        if not self.chain:
+            genesis = self.create_genesis_block()
+            if self.store:
+                self.store.append(genesis)
+            self.link_block(genesis)
+        # Feed sequence numbers derive from persisted counters, so cursors stay valid across restarts
+        self.feed.start_at(self.feed_seq())
 
     def create_genesis_block(self):
         return HealthBlock(0, "Genesis Block", "public", "0", "SYSTEM", expiry_years=100)
@@ -199,7 +688,192 @@ class HealthBlockchain:
     def get_latest_block(self):
         return self.chain[-1]
 
-    def register_user(self, role, profile_data, private_key_hex=None, patient_id=None):
+    def close(self):
+        """Snapshot the in-memory state and flush pending writes"""
+        if self.store:
+            self.save_snapshot()
+            self.store.close()
+            self.events.close()
+
+    def load_state(self):
+        """
+        Rebuild in-memory state from the latest snapshot, the block store and the journal
+
+        Blocks up to the snapshot height are loaded without re-indexing; only
+        later blocks are indexed and only journal events after the snapshot's
+        sequence number are replayed.
+        """
+        # Loading allocates millions of long-lived objects; cyclic GC passes over them are wasted work
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.load_blocks_and_events()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def load_blocks_and_events(self):
+        indexed_height = 0
+        missing_block_index = False  # snapshots from before the query indexes existed
+        snapshot = read_snapshot(self.snapshot_path)
+        if snapshot:
+            indexed_height, self.event_seq, payload = snapshot
+            state = pickle.loads(payload)
+            self.restore_state(state)
+            missing_block_index = 'block_index' not in state
+
+        for record in self.store.load():
+            block = HealthBlock.from_record(record, self.blobs)
+            self.link_block(block)
+            height = len(self.chain) - 1
+            if height > indexed_height:
+                self.index_block(height, block)
+            elif missing_block_index and height:
+                self.block_index.add(height, block)
+
+        if snapshot and indexed_height >= len(self.chain):
+            # The store lost blocks the snapshot had indexed: rebuild the block indexes
+            print(f"Block store is behind snapshot height {indexed_height}, re-indexing")
+            self.patient_blocks = {}
+            self.expiry_heap = []
+            self.block_index = BlockIndex(self.INDEXED_DATA_KEYS)
+            for height in range(1, len(self.chain)):
+                self.index_block(height, self.chain[height])
+        elif indexed_height:
+            self.block_heights.update((self.chain[h].digest, h) for h in range(1, indexed_height + 1))
+            # Blocks that expired before the last sweep were already marked; the rest go back on the heap
+            last_sweep = to_micros(self.last_expiry_sweep) if self.last_expiry_sweep else None
+            pending = []
+            for height in range(1, indexed_height + 1):
+                block = self.chain[height]
+                if last_sweep and block.expiry_us <= last_sweep:
+                    block.is_expired = True
+                else:
+                    pending.append((block.expiry_us, height))
+            self.expiry_heap.extend(pending)
+            heapq.heapify(self.expiry_heap)
+
+        self.replaying = True
+        try:
+            for seq, kind, args in self.events.load():
+                if seq > self.event_seq:
+                    self.event_seq = seq
+                    getattr(self, 'apply_' + kind)(*args)
+        finally:
+            self.replaying = False
+
+    def snapshot_state(self):
+        """Plain-data view of the in-memory state (caller holds write_lock)"""
+        return {
+            'users': self.users,
+            'user_roles': self.user_roles,
+            'user_profiles': {address: vars(profile) for address, profile in self.user_profiles.items()},
+            'patient_addresses': self.patient_addresses,
+            'address_patients': self.address_patients,
+            'patient_status': self.patient_status,
+            'access_requests': [vars(request) for request in self.access_requests.values()],
+            'request_expiry_heap': self.request_expiry_heap,
+            'request_seq': self.request_seq,
+            'authorized_roles': self.authorized_roles,
+            'last_expiry_sweep': self.last_expiry_sweep,
+            'patient_blocks': self.patient_blocks,
+            'block_index': self.block_index.state()
+        }
+
+    def restore_state(self, state):
+        """Load a snapshot_state() dict and rebuild the indexes derived from it"""
+        self.users = {
+            role: {address: public_wallet_info(info) for address, info in users.items()}
+            for role, users in state['users'].items()
+        }
+        self.user_roles = state['user_roles']
+        self.user_profiles = {
+            address: UserProfile.from_state(profile) for address, profile in state['user_profiles'].items()
+        }
+        self.patient_addresses = state['patient_addresses']
+        self.address_patients = state['address_patients']
+        self.patient_status = state['patient_status']
+        self.request_seq = state.get('request_seq', 0)
+        for request_state in state['access_requests']:
+            self.index_access_request(AccessRequest.from_state(request_state))
+        self.request_expiry_heap = state['request_expiry_heap']
+        self.apply_roles(state['authorized_roles'])
+        self.last_expiry_sweep = state['last_expiry_sweep']
+        self.patient_blocks = state['patient_blocks']
+        if 'block_index' in state:
+            self.block_index.restore(state['block_index'])
+
+    def save_snapshot(self):
+        """
+        Write a point-in-time snapshot tagged with chain height and event sequence
+
+        The state is serialized under write_lock; compression and the atomic
+        file write happen outside it. Journal segments covered by the
+        snapshot are deleted afterwards.
+
+        Returns:
+            (height, snapshot size in bytes), or None without a data directory
+        """
+        if not self.store:
+            return None
+        with self.snapshot_lock:
+            with self.write_lock:
+                self.store.sync()
+                height = len(self.chain) - 1
+                seq = self.event_seq
+                payload = pickle.dumps(self.snapshot_state(), protocol=pickle.HIGHEST_PROTOCOL)
+                if self.events.file is None:
+                    self.events.open_tail()
+                self.events.roll_segment()
+                first_segment = self.events.segments[-1]
+
+            size = write_snapshot(self.snapshot_path, height, seq, payload)
+            with self.write_lock:
+                self.events.truncate_before(first_segment)
+        return height, size
+
+    def feed_seq(self):
+        """
+        Sequence number for the change feed: journal sequence plus chain height
+
+        Every published change first appends a block or journals an event, so
+        this grows with each publish and is restored by a restart.
+        """
+        return self.event_seq + len(self.chain) - 1
+
+    def publish(self, kind, patient_id, details):
+        """Publish a change to subscribers (caller holds write_lock; skipped while replaying)"""
+        if not self.replaying:
+            self.feed.publish(self.feed_seq(), kind, patient_id, details)
+
+    def record_event(self, kind, *args):
+        """
+        Journal a state change and apply it (caller holds write_lock)
+
+        Each kind has an apply_<kind> method; replaying the journal calls the
+        same methods, so live changes and recovery share one code path.
+        """
+        self.event_seq += 1
+        if self.events and not self.replaying:
+            self.events.append((self.event_seq, kind, args))
+        return getattr(self, 'apply_' + kind)(*args)
+
+    def index_block(self, height, block, data=None):
+        """
+        Record block position in the per-patient, expiry and query indexes
+
+        Args:
+            data: Payload content the block was built from, if at hand (see BlockIndex.add)
+        """
+        positions = self.patient_blocks.setdefault(block.patient_id, {'all': []})
+        positions['all'].append(height)
+        positions.setdefault(block.access_level, []).append(height)
+        if not block.is_expired:
+            heapq.heappush(self.expiry_heap, (block.expiry_us, height))
+        self.block_heights[block.digest] = height
+        self.block_index.add(height, block, data)
+
+    def register_user(self, role, profile_data, private_key_hex=None, patient_id=None, wallet_info=None):
         """
         Register user with credential information
 
@@ -208,6 +882,7 @@ class HealthBlockchain:
             profile_data: dict with nama, umur, no_identitas, alamat, no_telp, specialization
             private_key_hex: Optional existing private key
             patient_id: Required for patient/ex-patient/family
+            wallet_info: Optional wallet already generated/derived by the caller
         """
         try:
             # Create user profile
@@ -221,8 +896,12 @@ class HealthBlockchain:
             )
 
             # Generate or import wallet
-            if private_key_hex:
-                wallet_info = WalletManager.get_public_key_from_private(private_key_hex)
+            if wallet_info:
+                wallet_info = dict(wallet_info)
+                if private_key_hex:
+                    wallet_info['private_key_hex'] = private_key_hex
+            elif private_key_hex:
+                wallet_info = WalletManager.derive_public_info(private_key_hex)
                 if not wallet_info:
                     return None
                 wallet_info['private_key_hex'] = private_key_hex
@@ -231,54 +910,64 @@ class HealthBlockchain:
                 if not wallet_info:
                     return None
 
-            address = wallet_info['address']
-
-            # Store user information
-            if role not in self.users:
-                self.users[role] = {}
-
-            self.users[role][address] = wallet_info
-            self.user_roles[address] = role
-            self.user_profiles[address] = profile
-
-            # Handle patient/ex-patient/family
-            if role in ['patient', 'ex-patient', 'family'] and patient_id:
-                if patient_id not in self.patient_addresses:
-                    self.patient_addresses[patient_id] = []
-                self.patient_addresses[patient_id].append(address)
+            wallet_info['profile'] = profile.to_dict()
 
-                # Set patient status
-                if role == 'patient':
-                    self.patient_status[patient_id] = 'active'
-                elif role == 'ex-patient':
-                    self.patient_status[patient_id] = 'ex-patient'
+            # The private key goes back to the caller only; it is never stored
+            with self.write_lock:
+                self.record_event('user', role, public_wallet_info(wallet_info), vars(profile), patient_id)
 
-            wallet_info['profile'] = profile.to_dict()
             return wallet_info
 
         except Exception as e:
             print(f"Error registering user: {e}")
             return None
 
+    def apply_user(self, role, wallet_info, profile_state, patient_id):
+        """Store a registered user and link patient/ex-patient/family addresses"""
+        address = wallet_info['address']
+
+        # Store user information (journals written before keys were stripped may still hold them)
+        self.users.setdefault(role, {})[address] = public_wallet_info(wallet_info)
+        self.user_roles[address] = role
+        self.user_profiles[address] = UserProfile.from_state(profile_state)
+        self.creator_names.pop(address, None)
+
+        # Handle patient/ex-patient/family
+        if role in ['patient', 'ex-patient', 'family'] and patient_id:
+            if patient_id not in self.patient_addresses:
+                self.patient_addresses[patient_id] = set()
+            self.patient_addresses[patient_id].add(address)
+            self.address_patients.setdefault(address, patient_id)
+
+            # Set patient status
+            if role == 'patient':
+                self.patient_status[patient_id] = 'active'
+            elif role == 'ex-patient':
+                self.patient_status[patient_id] = 'ex-patient'
+
     def convert_patient_to_ex_patient(self, patient_id):
         """Convert active patient to ex-patient"""
-        if patient_id in self.patient_status:
-            self.patient_status[patient_id] = 'ex-patient'
-
-            # Update role for all addresses linked to this patient
-            for address in self.patient_addresses.get(patient_id, []):
-                if self.user_roles.get(address) == 'patient':
-                    # Remove from patient role
-                    if address in self.users.get('patient', {}):
-                        wallet_info = self.users['patient'].pop(address)
-                        # Add to ex-patient role
-                        if 'ex-patient' not in self.users:
-                            self.users['ex-patient'] = {}
-                        self.users['ex-patient'][address] = wallet_info
-                        self.user_roles[address] = 'ex-patient'
+        with self.write_lock:
+            if patient_id in self.patient_status:
+                self.record_event('conversion', patient_id)
+                return True
+            return False
 
-            return True
-        return False
+    def apply_conversion(self, patient_id):
+        self.patient_status[patient_id] = 'ex-patient'
+        self.publish('conversion', patient_id, {'status': 'ex-patient'})
+
+        # Update role for all addresses linked to this patient
+        for address in self.patient_addresses.get(patient_id, ()):
+            if self.user_roles.get(address) == 'patient':
+                # Remove from patient role
+                if address in self.users.get('patient', {}):
+                    wallet_info = self.users['patient'].pop(address)
+                    # Add to ex-patient role
+                    if 'ex-patient' not in self.users:
+                        self.users['ex-patient'] = {}
+                    self.users['ex-patient'][address] = wallet_info
+                    self.user_roles[address] = 'ex-patient'
 
     def create_access_request(self, patient_id, requester_address, data_type):
         """Create a multi-signature access request"""
@@ -286,31 +975,279 @@ class HealthBlockchain:
             f"{patient_id}{requester_address}{datetime.datetime.now()}".encode()
         ).hexdigest()[:16]
 
-        request = AccessRequest(request_id, patient_id, requester_address, data_type)
-        self.access_requests[request_id] = request
+        request = AccessRequest(request_id, patient_id, requester_address, data_type, self.ACCESS_REQUEST_TTL)
+        with self.write_lock:
+            self.record_event('request', vars(request))
         return request_id
 
-    def sign_access_request(self, request_id, signer_address, private_key_hex):
-        """Sign an access request (for doctor/komite_medis)"""
+    def apply_request(self, request_state):
+        request = AccessRequest.from_state(request_state)
+        self.index_access_request(request)
+        if request.expires_at:
+            heapq.heappush(self.request_expiry_heap, (request.expires_at, request.request_id))
+
+    def index_access_request(self, request):
+        """Add a request to the request table and its patient, requester and status indexes"""
+        if getattr(request, 'seq', None) is None:
+            request.seq = self.request_seq + 1
+        self.request_seq = max(self.request_seq, request.seq)
+        request_id = request.request_id
+        self.access_requests[request_id] = request
+        self.requests_by_patient.setdefault(request.patient_id, {})[request_id] = request
+        self.requests_by_requester.setdefault(request.requester_address, {})[request_id] = request
+        self.requests_by_status.setdefault(request.status, {})[request_id] = request
+
+    def apply_signature(self, request_id, address, signature):
+        """Returns True once the request holds enough signatures to be verified"""
+        request = self.access_requests.get(request_id)
+        if not request:
+            return False
+        threshold_reached = request.add_signature(address, signature)
+        self.publish('signature', request.patient_id, {
+            'request_id': request_id, 'signer': address,
+            'signatures': len(request.signatures), 'status': request.status
+        })
+        return threshold_reached
+
+    def apply_verification(self, request_id, checked, valid_signers):
+        """Apply verification results to a request and move it between status indexes"""
+        request = self.access_requests.get(request_id)
+        if not request:
+            return
+        previous_status = request.status
+        request.mark_verified(checked, valid_signers)
+        if request.status != previous_status:
+            self.requests_by_status[previous_status].pop(request_id, None)
+            self.requests_by_status.setdefault(request.status, {})[request_id] = request
+            self.publish('request_status', request.patient_id, {'request_id': request_id, 'status': request.status})
+
+    def remove_access_request(self, request):
+        """Drop a request from the request table and all its indexes"""
+        request_id = request.request_id
+        self.access_requests.pop(request_id, None)
+        self.requests_by_status.get(request.status, {}).pop(request_id, None)
+        for index, key in ((self.requests_by_patient, request.patient_id),
+                           (self.requests_by_requester, request.requester_address)):
+            requests = index.get(key)
+            if requests is not None:
+                requests.pop(request_id, None)
+                if not requests:
+                    del index[key]
+
+    def purge_expired_requests(self, now=None):
+        """
+        Delete pending access requests whose TTL has passed
+
+        Popped from the expiry-ordered heap, so only requests that expired
+        since the previous purge are touched. Approved requests are kept.
+
+        Returns:
+            Number of requests purged
+        """
+        now = now or datetime.datetime.now()
+        with self.write_lock:
+            if self.request_expiry_heap and self.request_expiry_heap[0][0] <= now:
+                return self.record_event('purge', now)
+        return 0
+
+    def apply_purge(self, now):
+        purged = 0
+        while self.request_expiry_heap and self.request_expiry_heap[0][0] <= now:
+            _, request_id = heapq.heappop(self.request_expiry_heap)
+            request = self.access_requests.get(request_id)
+            if request and request.is_expired(now):
+                self.remove_access_request(request)
+                purged += 1
+        return purged
+
+    def list_access_requests(self, patient_id=None, requester=None, status=None, signer=None,
+                             cursor=None, limit=50):
+        """
+        List access requests from the smallest matching index
+
+        Args:
+            patient_id: Only requests for this patient
+            requester: Only requests made by this address
+            status: Only requests with this status ('pending' or 'approved')
+            signer: Only pending requests still awaiting this signer's signature
+            cursor: Creation seq of the last request already seen (next_cursor of
+                    the previous page); stable across purges and status changes
+            limit: Page size, at least 1
+
+        Returns:
+            (list of request dicts in creation order, next_cursor or None)
+
+        Raises:
+            ValueError: If limit < 1
+        """
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        now = datetime.datetime.now()
+        candidates = [self.access_requests]
+        if patient_id is not None:
+            candidates.append(self.requests_by_patient.get(patient_id, {}))
+        if requester is not None:
+            candidates.append(self.requests_by_requester.get(requester, {}))
+        if status is not None:
+            candidates.append(self.requests_by_status.get(status, {}))
+        if signer is not None:
+            candidates.append(self.requests_by_status['pending'])
+        # Read-only: copying a dict's values is atomic under the GIL, so no write_lock
+        requests = list(min(candidates, key=len).values())
+
+        after = cursor or 0
+
+        def matches(request):
+            return (request.seq > after
+                    and (patient_id is None or request.patient_id == patient_id)
+                    and (requester is None or request.requester_address == requester)
+                    and (status is None or request.status == status)
+                    and (signer is None or (request.status == "pending" and signer not in request.signatures))
+                    and not request.is_expired(now))
+
+        # Status indexes are not in creation order (approval moves a request), so sort by seq
+        page = heapq.nsmallest(limit + 1, filter(matches, requests), key=lambda request: request.seq)
+        next_cursor = page[limit - 1].seq if len(page) > limit else None
+        return [request.to_dict() for request in page[:limit]], next_cursor
+
+    def sign_access_request(self, request_id, signer_address, private_key_hex, signature=None):
+        """
+        Sign an access request (for doctor/komite_medis)
+
+        Args:
+            request_id: Access request ID
+            signer_address: Doctor or medical committee address
+            private_key_hex: Signer's private key
+            signature: Optional signature hex already made over request.signing_message()
+        """
         if request_id not in self.access_requests:
             return False, "Request not found"
 
         request = self.access_requests[request_id]
+        if request.is_expired():
+            return False, "Request expired"
         role = self.user_roles.get(signer_address)
 
         # Only doctor and komite_medis can sign
         if role not in ['doc', 'komite_medis']:
             return False, "Only doctor or medical committee can sign"
 
-        # Create signature
-        message = f"{request_id}{request.patient_id}{request.requester_address}"
-        signature = WalletManager.sign_message(private_key_hex, message)
+        # Create signature unless it was computed by the caller
+        if signature is None:
+            signature = WalletManager.sign_message(private_key_hex, request.signing_message())
+
+        if not signature:
+            return False, "Failed to create signature"
+
+        with self.write_lock:
+            threshold_reached = self.record_event('signature', request_id, signer_address, signature)
+        if threshold_reached:
+            # Enough signatures collected: verify all of them before approving
+            rejected = self.verify_access_request(request)
+            if signer_address in rejected:
+                return False, "Signature does not match signer's public key"
+        return True, "Signature added successfully"
+
+    def public_key_of(self, address):
+        """Registered public key of an address"""
+        return self.users.get(self.user_roles.get(address), {}).get(address, {}).get('public_key_hex')
+
+    def signature_items(self, request):
+        """(address, (public_key_hex, message, signature_hex)) for each signature of a request"""
+        message = request.signing_message()
+        return [
+            (address, (self.public_key_of(address), message, signature))
+            for address, signature in list(request.signatures.items())
+        ]
+
+    def verify_access_request(self, request):
+        """
+        Verify every signature of a request against the signers' registered keys
+
+        Invalid signatures are dropped; the request is approved once enough
+        valid signatures remain.
 
-        if signature:
-            request.add_signature(signer_address, signature)
-            return True, "Signature added successfully"
+        Returns:
+            Set of signer addresses whose signature was rejected
+        """
+        items = self.signature_items(request)
+        results = verify_signature_batch([item for _, item in items if item[0]])
+        results = iter(results)
+        valid = {address for address, item in items if item[0] and next(results)}
+        with self.write_lock:
+            self.record_event('verification', request.request_id,
+                              {address: item[2] for address, item in items}, valid)
+        return {address for address, _ in items} - valid
+
+    def verify_pending_requests(self, request_ids=None, workers=1, chunk_size=500, executor=None):
+        """
+        Bulk-verify the signatures of pending access requests
+
+        Args:
+            request_ids: Optional list of request IDs (default: all pending requests)
+            workers: Worker processes (at most the CPU count); signatures are
+                     verified in chunks in parallel
+            chunk_size: Signatures per chunk handed to a worker
+            executor: Existing process pool to run the chunks on instead of
+                      starting one for this call
+
+        Returns:
+            dict with verified, rejected and approved counts
+        """
+        if request_ids is None:
+            requests = [r for r in list(self.requests_by_status['pending'].values()) if r.signatures]
+        else:
+            requests = [self.access_requests[r] for r in request_ids if r in self.access_requests]
+
+        owners = []  # (request, address) per signature, aligned with items
+        items = []
+        checked = {request.request_id: {} for request in requests}
+        for request in requests:
+            for address, item in self.signature_items(request):
+                owners.append((request, address))
+                items.append(item if item[0] else None)
+                checked[request.request_id][address] = item[2]
+
+        checkable = [item for item in items if item]
+        chunks = [checkable[i:i + chunk_size] for i in range(0, len(checkable), chunk_size)]
+        workers = min(workers, os.cpu_count() or 1)
+        if workers > 1 and len(chunks) > 1 and executor is not None:
+            results = [ok for chunk in executor.map(verify_signature_batch, chunks) for ok in chunk]
+        elif workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = [ok for chunk in pool.map(verify_signature_batch, chunks) for ok in chunk]
+        else:
+            results = [ok for chunk in map(verify_signature_batch, chunks) for ok in chunk]
+
+        results = iter(results)
+        valid = {request.request_id: set() for request in requests}
+        for (request, address), item in zip(owners, items):
+            if item and next(results):
+                valid[request.request_id].add(address)
+
+        approved = 0
+        for request in requests:
+            with self.write_lock:
+                self.record_event('verification', request.request_id,
+                                  checked[request.request_id], valid[request.request_id])
+            approved += request.is_approved()
+
+        verified = sum(len(addresses) for addresses in valid.values())
+        return {
+            "requests": len(requests),
+            "verified": verified,
+            "rejected": len(items) - verified,
+            "approved": approved
+        }
 
-        return False, "Failed to create signature"
+    def set_authorized_roles(self, authorized_roles):
+        """Replace role rules and recompile the access policy"""
+        with self.write_lock:
+            self.record_event('roles', authorized_roles)
+
+    def apply_roles(self, authorized_roles):
+        self.authorized_roles = authorized_roles
+        self.policy = AccessPolicy(authorized_roles)
 
     def check_authorization(self, address, access_level, patient_id=None):
         """Check authorization with expiry consideration"""
@@ -318,47 +1255,207 @@ class HealthBlockchain:
             return False
 
         role = self.user_roles[address]
+        is_linked = bool(patient_id) and address in self.patient_addresses.get(patient_id, ())
+        return self.policy.can_write(role, access_level, is_linked)
 
-        if access_level == 'private':
-            return role in self.authorized_roles['private']
+    def prepare_payload(self, data):
+        """
+        Payload to put in a new block: the data itself, or a BlobRef once its
+        canonical JSON reaches BLOB_THRESHOLD bytes and a blob store exists
 
-        if access_level == 'patient':
-            if patient_id and address in self.patient_addresses.get(patient_id, []):
-                return True
-            return role in self.authorized_roles['private'] + self.authorized_roles['public']
+        Blobs are written (and fsynced) here, so call this outside write_lock.
+        """
+        if self.blobs is None or not isinstance(data, dict):
+            return data
+        content = canonical_json(data)
+        if len(content) < self.BLOB_THRESHOLD:
+            return data
+        return BlobRef(self.blobs, self.blobs.put(content))
+
+    def train_blob_dictionary(self, sample_blocks=500):
+        """
+        Train the blob store's compression dictionary on the most recent blob payloads
 
-        return role in self.authorized_roles['private'] + self.authorized_roles['public']
+        Returns:
+            Hex id of the new dictionary, or None without a blob store or samples
+        """
+        if self.blobs is None:
+            return None
+        samples = []
+        for block in reversed(self.chain):
+            if isinstance(block.payload, BlobRef):
+                samples.append(self.blobs.get(block.payload.digest))
+                if len(samples) >= sample_blocks:
+                    break
+        if not samples:
+            return None
+        return self.blobs.train_dictionary(samples[::-1])
 
     def add_block(self, patient_id, data, access_level, user_address, expiry_years=5):
         """Add a new block with expiry date"""
         try:
-            if self.check_authorization(user_address, access_level, patient_id):
-                new_block = HealthBlock(
-                    patient_id,
-                    data,
-                    access_level,
-                    self.get_latest_block().hash,
-                    user_address,
-                    expiry_years
-                )
-                self.chain.append(new_block)
-                return True
-            else:
+            # Checked before the blob write so unauthorized callers cannot fill the blob store
+            if not self.check_authorization(user_address, access_level, patient_id):
                 print(f"Authorization failed for address {user_address}")
                 return False
+            payload = self.prepare_payload(data)
+
+            with self.write_lock:
+                if self.check_authorization(user_address, access_level, patient_id):
+                    new_block = HealthBlock(
+                        patient_id,
+                        payload,
+                        access_level,
+                        self.get_latest_block().hash,
+                        user_address,
+                        expiry_years
+                    )
+                    self.append_blocks([new_block], [data])
+                    return True
+                else:
+                    print(f"Authorization failed for address {user_address}")
+                    return False
         except Exception as e:
             print(f"Error adding block: {e}")
             return False
 
-    def clean_expired_blocks(self):
-        """Mark expired blocks (data older than 5 years)"""
+    def add_blocks(self, records):
+        """
+        Add a batch of health records in a single append
+
+        Authorization is checked once per creator/access level/patient
+        combination. Authorized records are hashed into a chain segment and
+        appended together; if the store write fails, none are appended.
+
+        Args:
+            records: List of dicts with patient_id, data, access_level,
+                     user_address and optional expiry_years
+
+        Returns:
+            List of per-record results: {'success', 'block_hash'} or {'success', 'error'}
+        """
+        # Large payloads of authorized records go to the blob store before the lock is taken
+        payloads = []
+        authorized = {}
+        for record in records:
+            try:
+                key = (record['user_address'], record['access_level'],
+                       record['patient_id'] if record['access_level'] == 'patient' else None)
+                if key not in authorized:
+                    authorized[key] = self.check_authorization(
+                        record['user_address'], record['access_level'], record['patient_id'])
+                payloads.append(self.prepare_payload(record['data']) if authorized[key] else None)
+            except Exception:
+                payloads.append(None)  # reported by the loop below
+
+        with self.write_lock:
+            results = []
+            new_blocks = []
+            contents = []
+            authorized = {}  # {(address, access_level, patient_id): bool}
+            previous_hash = self.get_latest_block().hash
+
+            for record, payload in zip(records, payloads):
+                try:
+                    patient_id = record['patient_id']
+                    access_level = record['access_level']
+                    user_address = record['user_address']
+
+                    key = (user_address, access_level, patient_id if access_level == 'patient' else None)
+                    if key not in authorized:
+                        authorized[key] = self.check_authorization(user_address, access_level, patient_id)
+                    if not authorized[key]:
+                        results.append({'success': False, 'error': 'Authorization failed'})
+                        continue
+
+                    new_block = HealthBlock(
+                        patient_id,
+                        record['data'] if payload is None else payload,
+                        access_level,
+                        previous_hash,
+                        user_address,
+                        record.get('expiry_years', 5)
+                    )
+                    previous_hash = new_block.hash
+                    new_blocks.append(new_block)
+                    contents.append(record['data'])
+                    results.append({'success': True, 'block_hash': new_block.hash})
+                except Exception as e:
+                    results.append({'success': False, 'error': str(e)})
+
+            try:
+                self.append_blocks(new_blocks, contents)
+            except Exception as e:
+                print(f"Error adding blocks: {e}")
+                return [{'success': False, 'error': str(e)} for _ in records]
+
+        return results
+
+    def append_blocks(self, new_blocks, contents=None):
+        """
+        Persist and append already-linked blocks, then index them (hold write_lock)
+
+        Args:
+            contents: Optional payload content of each block (the data given to
+                      prepare_payload), so blob-store payloads are indexed
+                      without reading them back
+        """
+        if not new_blocks:
+            return
+        if self.store:
+            self.store.append_many(new_blocks)
+        for new_block, data in zip(new_blocks, contents or itertools.repeat(None)):
+            self.link_block(new_block)
+            self.index_block(len(self.chain) - 1, new_block, data)
+            self.publish('block', new_block.patient_id, {'height': len(self.chain) - 1})
+
+    def link_block(self, block):
+        """
+        Append a block to the in-memory chain, sharing its predecessor's digest
+        object, and record its time in the time index
+        """
+        if self.chain and block.previous_digest == self.chain[-1].digest:
+            block.previous_digest = self.chain[-1].digest
+        # A clock stepping backwards must not break the bisect order
+        times = self.block_times
+        times.append(max(block.timestamp_us, times[-1]) if times else block.timestamp_us)
+        self.chain.append(block)
+
+    def creator_name(self, address):
+        """Display name of a block creator, cached until their profile changes"""
+        name = self.creator_names.get(address)
+        if name is None:
+            profile = self.user_profiles.get(address)
+            if isinstance(profile, dict):
+                name = profile.get('nama', 'Unknown')
+            else:
+                name = profile.nama if profile else 'Unknown'
+            self.creator_names[address] = name
+        return name
+
+    def clean_expired_blocks(self, now=None):
+        """
+        Mark blocks whose expiry date has passed (data older than 5 years)
+
+        Only blocks that crossed their deadline since the previous sweep are
+        touched, popped from the expiry-ordered heap.
+
+        Returns:
+            Number of blocks newly marked as expired
+        """
+        now = now or datetime.datetime.now()
+        now_us = to_micros(now)
         expired_count = 0
-        for block in self.chain[1:]:
-            if block.check_expiry():
+        with self.write_lock:
+            self.last_expiry_sweep = now
+            while self.expiry_heap and self.expiry_heap[0][0] <= now_us:
+                _, height = heapq.heappop(self.expiry_heap)
+                self.chain[height].is_expired = True
                 expired_count += 1
         return expired_count
 
-    def get_patient_data(self, patient_id, user_address, request_id=None):
+    def get_patient_data(self, patient_id, user_address, request_id=None, fields=None,
+                         since_us=None, until_us=None):
         """
         Get patient data with multi-signature support
 
@@ -366,6 +1463,8 @@ class HealthBlockchain:
             patient_id: Patient ID
             user_address: Requester's address
             request_id: Optional access request ID for multi-sig approval
+            fields: Optional projection, see parse_fields
+            since_us, until_us: Optional creation time window [since, until) in epoch microseconds
         """
         patient_data = {
             'public': [],
@@ -375,65 +1474,263 @@ class HealthBlockchain:
         }
 
         try:
-            role = self.user_roles.get(user_address)
-            is_patient_or_family = user_address in self.patient_addresses.get(patient_id, [])
-
-            # Check if multisig approval is needed and valid
-            needs_multisig = is_patient_or_family and role in ['patient', 'ex-patient', 'family']
-            multisig_approved = False
-
-            if needs_multisig and request_id:
-                request = self.access_requests.get(request_id)
-                if request and request.is_approved():
-                    multisig_approved = True
-
-            for block in self.chain[1:]:
-                if block.patient_id == patient_id:
-                    # Check expiry
-                    if block.check_expiry():
-                        patient_data['expired'].append({
-                            'data': '[EXPIRED - Data removed after 5 years]',
-                            'expired_date': block.expiry_date.strftime("%Y-%m-%d"),
-                            'block_hash': block.hash
-                        })
-                        continue
-
-                    block_info = {
-                        'data': block.data,
-                        'timestamp': block.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                        'created_by': block.creator_address,
-                        'created_by_name': self.user_profiles.get(block.creator_address, {}).get('nama', 'Unknown') if isinstance(self.user_profiles.get(block.creator_address), dict) else self.user_profiles.get(block.creator_address).nama if self.user_profiles.get(block.creator_address) else 'Unknown',
-                        'expiry_date': block.expiry_date.strftime("%Y-%m-%d"),
-                        'block_hash': block.hash
-                    }
-
-                    # Public data - accessible by medical staff
-                    if block.access_level == 'public':
-                        if role in self.authorized_roles['public']:
-                            patient_data['public'].append(block_info)
-
-                    # Private data - needs multisig for patient/family
-                    elif block.access_level == 'private':
-                        if role in self.authorized_roles['private']:
-                            patient_data['private'].append(block_info)
-                        elif needs_multisig and multisig_approved:
-                            patient_data['private'].append(block_info)
-
-                    # Patient-specific data
-                    elif block.access_level == 'patient':
-                        if is_patient_or_family:
-                            patient_data['patient'].append(block_info)
-                        elif role in self.authorized_roles['private'] + self.authorized_roles['public']:
-                            patient_data['patient'].append(block_info)
-
+            for _, category, block_info in self.iter_patient_data(patient_id, user_address, request_id,
+                                                                  fields=fields, since_us=since_us,
+                                                                  until_us=until_us):
+                patient_data[category].append(block_info)
         except Exception as e:
             print(f"Error retrieving patient data: {e}")
 
         return patient_data
 
-    def login_with_private_key(self, private_key_hex):
-        """Login with private key"""
-        wallet_info = WalletManager.get_public_key_from_private(private_key_hex)
+    def iter_patient_data(self, patient_id, user_address, request_id=None, after=None, fields=None,
+                          since_us=None, until_us=None):
+        """
+        Yield patient records the user may read, in chain order
+
+        Args:
+            patient_id: Patient ID
+            user_address: Requester's address
+            request_id: Optional access request ID for multi-sig approval
+            after: Optional cursor; only blocks above this height are returned
+            fields: Optional projection (see parse_fields); records then only
+                    hold the selected columns, and payloads are not read at
+                    all unless data or a data key is selected. Expired
+                    records keep their fixed shape.
+            since_us, until_us: Optional creation time window [since, until) in
+                    epoch microseconds, mapped to a height range through the
+                    time index
+
+        Yields:
+            (height, category, block_info) where category is public, private,
+            patient or expired
+        """
+        projection = parse_fields(fields) if fields is not None else None
+        role = self.user_roles.get(user_address)
+        is_patient_or_family = user_address in self.patient_addresses.get(patient_id, ())
+
+        # Private data needs multisig approval for patient/family
+        needs_multisig = is_patient_or_family and role in self.policy.patient_roles
+        multisig_approved = False
+
+        if needs_multisig and request_id:
+            request = self.access_requests.get(request_id)
+            if request and request.is_approved():
+                multisig_approved = True
+
+        # Appends never modify existing entries, so reading up to the tip
+        # seen at the start gives a consistent snapshot without locking
+        tip = len(self.chain)
+        now_us = to_micros(datetime.datetime.now())
+        positions = self.patient_blocks.get(patient_id, {}).get('all', [])
+        if since_us is not None or until_us is not None:
+            heights = self.height_range(since_us, until_us, tip)
+            after = max(after, heights.start - 1) if after is not None else heights.start - 1
+            tip = heights.stop
+        start = bisect.bisect_right(positions, after) if after is not None else 0
+
+        for index in range(start, len(positions)):
+            height = positions[index]
+            if height >= tip:
+                break
+            block = self.chain[height]
+            # Check expiry (the sweeper may not have reached this block yet)
+            if block.is_expired or block.expiry_us <= now_us:
+                yield height, 'expired', {
+                    'data': '[EXPIRED - Data removed after 5 years]',
+                    'expired_date': block.expiry_date.strftime("%Y-%m-%d"),
+                    'block_hash': block.hash
+                }
+                continue
+
+            if not self.policy.can_read(role, block.access_level, is_patient_or_family,
+                                        needs_multisig and multisig_approved):
+                continue
+
+            if projection is not None:
+                yield height, block.access_level, self.project_block(block, *projection)
+                continue
+
+            block_info = dict(block.info(self.block_views))
+            block_info['created_by_name'] = self.creator_name(block.creator_address)
+
+            yield height, block.access_level, block_info
+
+    def project_block(self, block, columns, data_keys):
+        """Read view of a block limited to a parsed projection"""
+        record = {}
+        if data_keys is None:
+            record['data'] = block.data
+        elif data_keys:
+            data = block.data
+            record['data'] = {k: data[k] for k in data_keys if k in data} if isinstance(data, dict) else {}
+        if columns:
+            info = self.block_views.get(block)
+            for column in columns:
+                if column == 'created_by_name':
+                    record[column] = self.creator_name(block.creator_address)
+                else:
+                    record[column] = info[column]
+        return record
+
+    def height_range(self, since_us=None, until_us=None, tip=None):
+        """
+        Heights of blocks created in [since_us, until_us), in O(log n)
+
+        Bisects block_times, so a block written while the clock had stepped
+        back counts as created at its predecessor's time.
+        """
+        tip = tip or len(self.chain)
+        times = self.block_times
+        low = bisect.bisect_left(times, since_us, 1, tip) if since_us is not None else 1
+        high = bisect.bisect_left(times, until_us, low, tip) if until_us is not None else tip
+        return range(low, high)
+
+    def approved_patient(self, request_id):
+        """Patient whose private blocks an approved access request unlocks, or None"""
+        if request_id:
+            request = self.access_requests.get(request_id)
+            if request and request.is_approved():
+                return request.patient_id
+        return None
+
+    def can_read_block(self, user_address, role, block, approved_patient=None):
+        """Whether the user may read a block under the access rules of its patient"""
+        is_linked = user_address in self.patient_addresses.get(block.patient_id, ())
+        multisig_approved = (is_linked and role in self.policy.patient_roles
+                             and approved_patient == block.patient_id)
+        return self.policy.can_read(role, block.access_level, is_linked, multisig_approved)
+
+    def block_view(self, height, block, projection=None):
+        """Block read view (or a parsed projection of it) with height, patient_id and access_level"""
+        if projection is not None:
+            record = self.project_block(block, *projection)
+        else:
+            record = dict(block.info(self.block_views))
+            record['created_by_name'] = self.creator_name(block.creator_address)
+        record.update(height=height, patient_id=block.patient_id, access_level=block.access_level)
+        return record
+
+    def feed_view(self, user_address, event, patient_id=None, request_id=None, projection=None):
+        """
+        What a subscriber may see of a change-feed event
+
+        Block events carry the block view, checked against the block's access
+        rules; conversion and access-request events are shown to staff, to
+        addresses linked to the patient and to the request's requester.
+
+        Args:
+            user_address: Subscriber's address
+            event: (seq, kind, patient_id, details) from ChangeFeed
+            patient_id: Optional patient filter
+            request_id: Optional approved access request, as for query()
+            projection: Optional parsed projection for block views
+
+        Returns:
+            Event data dict, or None if the event is filtered out
+        """
+        _, kind, event_patient, details = event
+        if patient_id is not None and event_patient != patient_id:
+            return None
+        role = self.user_roles.get(user_address)
+        if role is None:
+            return None
+
+        if kind == 'block':
+            height = details['height']
+            block = self.chain[height]
+            if not self.can_read_block(user_address, role, block, self.approved_patient(request_id)):
+                return None
+            return self.block_view(height, block, projection)
+
+        if (role in self.policy.staff_roles
+                or user_address in self.patient_addresses.get(event_patient, ())):
+            return dict(details, patient_id=event_patient)
+        request = self.access_requests.get(details.get('request_id'))
+        if request and request.requester_address == user_address:
+            return dict(details, patient_id=event_patient)
+        return None
+
+    def chain_tail(self, user_address, since_us, after=None, limit=100, fields=None):
+        """
+        Blocks created since since_us that the user may read, oldest first
+
+        Returns:
+            (results, next_cursor) as from query()
+        """
+        results, next_cursor, _ = self.query(user_address, Query(since_us=since_us),
+                                             after=after, limit=limit, fields=fields)
+        return results, next_cursor
+
+    def query(self, user_address, query, request_id=None, after=None, limit=100, fields=None):
+        """
+        Find blocks matching a Query that the user may read
+
+        The candidates come from the most selective index (see Query.candidates);
+        each one is checked against the access rules of its own patient before
+        its remaining filters, so payloads the user cannot read are never
+        loaded. Expired blocks are never returned.
+
+        Args:
+            user_address: Requester's address
+            query: Query with the filters
+            request_id: Optional approved access request, unlocking private
+                        blocks of its patient for patient/family roles
+            after: Optional cursor; only blocks above this height are returned
+            limit: Maximum number of results, clamped to 1..QUERY_LIMIT
+            fields: Optional projection, see parse_fields
+
+        Returns:
+            (results, next_cursor, plan) where results are block views with
+            height, patient_id and access_level added, next_cursor is the height
+            to pass as `after` for the next page (None on the last page) and plan
+            is {'index', 'candidates'}
+        """
+        projection = parse_fields(fields) if fields is not None else None
+        limit = min(max(limit, 1), self.QUERY_LIMIT)
+        role = self.user_roles.get(user_address)
+        if role is None:
+            return [], None, {'index': None, 'candidates': 0}
+
+        unbuilt = [key for key in query.data
+                   if key in self.block_index.data_keys and key not in self.block_index.by_data]
+        for key in unbuilt:
+            # Scan (and load blob payloads) outside the lock, then catch up under it
+            tip = len(self.chain)
+            values = self.block_index.scan_data(key, self.chain, 1, tip)
+            with self.write_lock:
+                if key not in self.block_index.by_data:
+                    self.block_index.scan_data(key, self.chain, tip, len(self.chain), values)
+                    self.block_index.set_data_index(key, values)
+
+        approved_patient = self.approved_patient(request_id)
+        tip = len(self.chain)
+        now_us = to_micros(datetime.datetime.now())
+        index, heights = query.candidates(self, tip)
+        results = []
+        next_cursor = None
+
+        for position in range(Query.start(heights, after), len(heights)):
+            height = heights[position]
+            if height >= tip:
+                break
+            block = self.chain[height]
+            if block.is_expired or block.expiry_us <= now_us:
+                continue
+            if not self.can_read_block(user_address, role, block, approved_patient):
+                continue
+            if not query.matches(block, index):
+                continue
+            results.append(self.block_view(height, block, projection))
+            if len(results) == limit:
+                next_cursor = height
+                break
+
+        return results, next_cursor, {'index': index, 'candidates': len(heights)}
+
+    def login_with_private_key(self, private_key_hex, wallet_info=None):
+        """Login with private key (or its already-derived public info)"""
+        wallet_info = wallet_info or WalletManager.derive_public_info(private_key_hex)
         if not wallet_info:
             return {"error": "Invalid private key"}
 
@@ -444,11 +1741,7 @@ class HealthBlockchain:
         role = self.user_roles[address]
         profile = self.user_profiles.get(address)
 
-        patient_id = None
-        for pid, addresses in self.patient_addresses.items():
-            if address in addresses:
-                patient_id = pid
-                break
+        patient_id = self.address_patients.get(address)
 
         return {
             "address": address,
@@ -456,7 +1749,7 @@ class HealthBlockchain:
             "patient_id": patient_id,
             "profile": profile.to_dict() if profile else None,
             "wallet_info": wallet_info,
-            "can_access_private": role in self.authorized_roles['private']
+            "can_access_private": self.policy.can_access_private(role)
         }
 
     def login_with_address(self, address):
@@ -467,39 +1760,210 @@ class HealthBlockchain:
         role = self.user_roles[address]
         profile = self.user_profiles.get(address)
 
-        patient_id = None
-        for pid, addresses in self.patient_addresses.items():
-            if address in addresses:
-                patient_id = pid
-                break
+        patient_id = self.address_patients.get(address)
 
         return {
             "address": address,
             "role": role,
             "patient_id": patient_id,
             "profile": profile.to_dict() if profile else None,
-            "can_access_private": role in self.authorized_roles['private']
+            "can_access_private": self.policy.can_access_private(role)
         }
 
-    def verify_chain(self):
-        """Verify blockchain integrity"""
-        try:
-            for i in range(1, len(self.chain)):
-                current_block = self.chain[i]
-                previous_block = self.chain[i-1]
+    def verify_chain(self, full=False, start=None, end=None):
+        """
+        Verify blockchain integrity
 
-                if current_block.hash != current_block.calculate_hash():
-                    print(f"Block {i} hash is invalid")
-                    return False
+        Only blocks appended since the last successful check are re-hashed,
+        unless a full re-audit is requested.
 
-                if current_block.previous_hash != previous_block.hash:
-                    print(f"Block {i} previous hash doesn't match")
-                    return False
+        Args:
+            full: Re-hash every block from index 1 (or the given range)
+            start: Optional first block index of a full re-audit
+            end: Optional last block index (inclusive) of a full re-audit
 
-            return True
+        Returns:
+            True if the checked blocks are valid
+        """
+        return self.verify_chain_stats(full, start, end)[0]
+
+    def verify_chain_stats(self, full=False, start=None, end=None):
+        """
+        verify_chain that also reports its work
+
+        Returns:
+            (is_valid, rehashed) where rehashed is the number of blocks hashed
+
+        Raises:
+            ValueError: If start < 1, end < 0 or end < start
+        """
+        if start is not None and start < 1:
+            raise ValueError("start must be at least 1")
+        if end is not None and (end < 0 or end < (start or 1)):
+            raise ValueError("end must not be below start")
+        with self.verify_lock:
+            rehashed = 0
+            try:
+                last = len(self.chain) - 1
+                checkpoint_valid = (
+                    self.verified_height <= last and
+                    self.chain[self.verified_height].digest == self.verified_tip_hash
+                )
+
+                if full:
+                    first = max(start or 1, 1)
+                    last = min(end, last) if end is not None else last
+                elif checkpoint_valid:
+                    first = self.verified_height + 1
+                else:
+                    first = 1
+
+                for i in range(first, last + 1):
+                    current_block = self.chain[i]
+                    previous_block = self.chain[i-1]
+                    rehashed += 1
+
+                    if current_block.digest != current_block.calculate_digest():
+                        print(f"Block {i} hash is invalid")
+                        self.verified_height, self.verified_tip_hash = 0, None
+                        return False, rehashed
+
+                    if current_block.previous_digest != previous_block.digest:
+                        print(f"Block {i} previous hash doesn't match")
+                        self.verified_height, self.verified_tip_hash = 0, None
+                        return False, rehashed
+
+                # A range audit only moves the checkpoint if it continues from it
+                if checkpoint_valid and first <= self.verified_height + 1:
+                    height = max(self.verified_height, last)
+                elif first == 1:
+                    height = last
+                else:
+                    height = None
+
+                if height is not None and height >= 0:
+                    self.verified_height = height
+                    self.verified_tip_hash = self.chain[height].digest
+
+                return True, rehashed
+            except Exception as e:
+                print(f"Error verifying chain: {e}")
+                return False, rehashed
+
+    def audit_chain_parallel(self, workers=None, segment_size=None):
+        """
+        Full integrity audit split into segments across a process pool
+
+        Workers read their segment from the block store through its offset
+        index; only (directory, offsets, height, hash) tuples are sent to them.
+        Without a store, or with one worker, the in-memory chain is verified
+        in this process.
+
+        Args:
+            workers: Number of worker processes (default and maximum: CPU count)
+            segment_size: Blocks per segment (default: 4 segments per worker)
+
+        Returns:
+            (is_valid, first_bad_index) where first_bad_index is None if valid
+        """
+        cpus = os.cpu_count() or 1
+        workers = max(1, min(workers or cpus, cpus))
+        total = len(self.chain) - 1
+        segment_size = segment_size or max(1, -(-total // (workers * 4)))
+
+        first_bad = None
+        try:
+            if workers == 1 or self.store is None:
+                first_bad = verify_segment(1, self.chain[1:total + 1], self.chain[0].hash)
+            else:
+                with self.write_lock:
+                    self.store.sync()  # workers read the files, not our write buffer
+                segments = [
+                    (self.store.directory, self.store.runs(start, min(start + segment_size, total + 1) - 1),
+                     start, self.chain[start - 1].hash)
+                    for start in range(1, total + 1, segment_size)
+                ]
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # map() yields in segment order, so the first hit is the lowest index
+                    for result in executor.map(_verify_stored_segment_task, segments):
+                        if result is not None:
+                            first_bad = result
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            break
         except Exception as e:
-            print(f"Error verifying chain: {e}")
-            return False
+            print(f"Error auditing chain: {e}")
+            return False, None
+
+        if first_bad is not None:
+            print(f"Block {first_bad} failed verification")
+            with self.verify_lock:
+                self.verified_height, self.verified_tip_hash = 0, None
+            return False, first_bad
+
+        with self.verify_lock:
+            self.verified_height = total
+            self.verified_tip_hash = self.chain[total].digest
+        return True, None
+
+    def merkle_batch(self, height):
+        """Batch number and the [first, last] heights it covers (genesis excluded)"""
+        batch = (height - 1) // self.MERKLE_BATCH_SIZE
+        first = batch * self.MERKLE_BATCH_SIZE + 1
+        return batch, first, first + self.MERKLE_BATCH_SIZE - 1
+
+    def get_merkle_root(self, batch):
+        """
+        Merkle root of a batch of blocks
+
+        Returns:
+            (root, sealed) where sealed is False for the still-growing tail batch;
+            root is None for a batch that does not exist
+        """
+        if batch < 0:
+            return None, False
+        if batch in self.merkle_roots:
+            return self.merkle_roots[batch], True
+
+        first = batch * self.MERKLE_BATCH_SIZE + 1
+        tip = len(self.chain)
+        hashes = [block.hash for block in self.chain[first:min(first + self.MERKLE_BATCH_SIZE, tip)]]
+        root = merkle_root(hashes)
+        sealed = first + self.MERKLE_BATCH_SIZE <= tip
+        if sealed:
+            self.merkle_roots[batch] = root
+        return root, sealed
+
+    def get_merkle_proof(self, block_hash):
+        """
+        O(log n) inclusion proof of a block within its Merkle batch
+
+        Check it with merkle.verify_proof(block_hash, proof, root).
+        """
+        try:
+            height = self.block_heights.get(bytes.fromhex(block_hash))
+        except ValueError:
+            return None
+        if height is None:
+            return None
+
+        batch, first, last = self.merkle_batch(height)
+        last = min(last, len(self.chain) - 1)
+        hashes = [block.hash for block in self.chain[first:last + 1]]
+        root, sealed = self.get_merkle_root(batch)
+        if not sealed:
+            # The tail may have grown since; prove against the exact leaves used
+            root = merkle_root(hashes)
+
+        return {
+            "block_hash": block_hash,
+            "height": height,
+            "batch": batch,
+            "batch_start": first,
+            "batch_end": last,
+            "sealed": sealed,
+            "root": root,
+            "proof": merkle_proof(hashes, height - first)
+        }
 
 
 # ============= INTERACTIVE MENU SYSTEM =============
@@ -522,6 +1986,7 @@ def print_menu():
     print("12. Clean Expired Data (5+ years old)")
     print("13. Verify Blockchain Integrity")
     print("14. Run Demo (Auto)")
+    print("15. Parallel Full Audit")
     print("0.  Exit")
     print("="*70)
 
@@ -841,7 +2306,7 @@ def view_all_users(blockchain):
             profile = blockchain.user_profiles.get(address)
             print(f"  Name: {profile.nama if profile else 'N/A'}")
             print(f"  Address: {address}")
-            print(f"  Private Key: {wallet['private_key_hex'][:20]}...")
+            print(f"  Public Key: {wallet['public_key_hex'][:20]}...")
             if profile:
                 print(f"  Phone: {profile.no_telp}")
                 print(f"  ID: {profile.no_identitas}")
@@ -854,7 +2319,7 @@ def clean_expired_data(blockchain):
     expired_count = blockchain.clean_expired_blocks()
 
     print(f"\n✓ Scan completed!")
-    print(f"Total expired blocks marked: {expired_count}")
+    print(f"Newly expired blocks marked: {expired_count}")
     print("\nNote: Expired data is marked but kept in blockchain for audit trail.")
     print("Expired data content is replaced with '[EXPIRED - Data removed after 5 years]'")
 
@@ -1047,11 +2512,20 @@ def main():
         elif choice == '12':
             clean_expired_data(blockchain)
         elif choice == '13':
-            is_valid = blockchain.verify_chain()
+            full = input("Full re-audit? (yes/no): ").strip().lower() == 'yes'
+            is_valid, rehashed = blockchain.verify_chain_stats(full=full)
             print(f"\nBlockchain is {'VALID ✓' if is_valid else 'INVALID ✗'}")
+            print(f"Blocks re-hashed: {rehashed}")
             print(f"Total blocks: {len(blockchain.chain)}")
         elif choice == '14':
             run_demo(blockchain)
+        elif choice == '15':
+            workers = input("Worker processes (default CPU count): ").strip()
+            is_valid, first_bad = blockchain.audit_chain_parallel(int(workers) if workers else None)
+            print(f"\nBlockchain is {'VALID ✓' if is_valid else 'INVALID ✗'}")
+            if first_bad is not None:
+                print(f"First invalid block: {first_bad}")
+            print(f"Total blocks: {len(blockchain.chain)}")
         elif choice == '0':
             print("\nExiting... Thank you for using RS MediTrust!")
             break
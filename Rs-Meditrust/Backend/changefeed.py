@@ -0,0 +1,101 @@
+"""
+Change feed of chain and access-request updates
+
+Writers publish (seq, kind, patient_id, details) events in increasing seq
+order; the last `size` events are kept in memory. Subscribers resume from a
+cursor (the last seq they saw) and are woken as soon as something is
+published, from whichever thread published it. A subscriber whose cursor is
+older than the oldest kept event gets a 'reset' event first and should
+refetch its view before applying what follows.
+"""
+import asyncio
+import threading
+from collections import deque
+
+
+class ChangeFeed:
+    def __init__(self, size=10000, seq=0):
+        """
+        Args:
+            size: Number of recent events kept for resuming subscribers
+            seq: Sequence number of the last event already published
+        """
+        self.events = deque(maxlen=size)  # (seq, kind, patient_id, details) oldest first
+        self.seq = seq  # last published sequence number
+        self.floor = seq  # events up to this seq may no longer be available
+        self.lock = threading.Lock()
+        self.waiters = set()  # {(event loop, asyncio.Event)} of listening subscribers
+
+    def start_at(self, seq):
+        """Continue numbering after seq, e.g. after reloading persisted state"""
+        with self.lock:
+            self.seq = self.floor = seq
+            self.events.clear()
+
+    def publish(self, seq, kind, patient_id, details):
+        """Append an event; seq must be greater than the last published one"""
+        with self.lock:
+            if seq <= self.seq:
+                raise ValueError(f"Change feed sequence went backwards ({seq} <= {self.seq})")
+            if len(self.events) == self.events.maxlen:
+                self.floor = self.events[0][0]
+            self.events.append((seq, kind, patient_id, details))
+            self.seq = seq
+            waiters = list(self.waiters)
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def since(self, cursor):
+        """
+        Events published after cursor
+
+        Returns:
+            (events, complete) where complete is False if events between the
+            cursor and the oldest kept event were dropped
+        """
+        with self.lock:
+            events = []
+            for event in reversed(self.events):
+                if event[0] <= cursor:
+                    break
+                events.append(event)
+            events.reverse()
+            return events, cursor >= self.floor
+
+    async def listen(self, cursor=None, keepalive=15):
+        """
+        Yield events after cursor as they are published
+
+        Args:
+            cursor: Last seq the subscriber saw; None starts at the current tip
+            keepalive: Seconds without events after which None is yielded
+
+        Yields:
+            (seq, kind, patient_id, details), (floor, 'reset', None, {}) when
+            events were missed, or None as a keepalive tick
+        """
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self.lock:
+            self.waiters.add(waiter)
+            if cursor is None:
+                cursor = self.seq
+        try:
+            while True:
+                wakeup.clear()
+                events, complete = self.since(cursor)
+                if not complete:
+                    cursor = self.floor
+                    yield cursor, 'reset', None, {}
+                    continue
+                for event in events:
+                    cursor = event[0]
+                    yield event
+                if not events:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            with self.lock:
+                self.waiters.discard(waiter)
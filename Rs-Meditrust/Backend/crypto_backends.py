@@ -0,0 +1,187 @@
+"""
+secp256k1 backends for WalletManager
+
+Every backend produces the same 65-byte uncompressed public keys and the same
+raw 64-byte r||s signatures over SHA1(message), the format the pure-Python
+ecdsa package has always used, so addresses and stored signatures stay valid
+whichever backend is active. Native backends are optional and picked
+automatically when installed (coincurve, then cryptography); ecdsa is the
+fallback. Set MEDITRUST_CRYPTO_BACKEND to force one.
+"""
+import functools
+import hashlib
+import os
+
+from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
+from ecdsa.ellipticcurve import PointJacobi
+from ecdsa.util import sigencode_der, sigdecode_der
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import (
+        Prehashed, decode_dss_signature, encode_dss_signature
+    )
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:
+    ec = None
+
+ORDER = SECP256k1.order
+HALF_ORDER = ORDER // 2
+VERIFYING_KEY_CACHE_SIZE = 4096
+
+
+def digest(message):
+    """SHA1 digest the ecdsa package signs by default"""
+    return hashlib.sha1(message).digest()
+
+
+def split_signature(signature):
+    """Raw r||s signature as integers"""
+    if len(signature) != 64:
+        raise ValueError("Signature must be 64 bytes")
+    return int.from_bytes(signature[:32], 'big'), int.from_bytes(signature[32:], 'big')
+
+
+def join_signature(r, s):
+    return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+
+class EcdsaBackend:
+    """Pure-Python ecdsa package, always available"""
+    name = "ecdsa"
+
+    def __init__(self):
+        self.load_public = functools.lru_cache(maxsize=VERIFYING_KEY_CACHE_SIZE)(self._load_public)
+
+    def generate(self):
+        return SigningKey.generate(curve=SECP256k1).to_string()
+
+    def load_private(self, private_key_bytes):
+        return SigningKey.from_string(private_key_bytes, curve=SECP256k1)
+
+    def public_key(self, private_key):
+        return b'\x04' + private_key.get_verifying_key().to_string()
+
+    def sign(self, private_key, message):
+        return private_key.sign(message)
+
+    def _load_public(self, public_key_bytes):
+        """
+        VerifyingKey with a precomputed multiplication table
+
+        The point is rebuilt with the curve order so ecdsa can precompute;
+        that costs ~10 ms once and roughly halves every later verification.
+        """
+        point = VerifyingKey.from_string(public_key_bytes[1:], curve=SECP256k1).pubkey.point
+        point = PointJacobi(SECP256k1.curve, point.x(), point.y(), 1, ORDER, generator=True)
+        vk = VerifyingKey.from_public_point(point, curve=SECP256k1)
+        vk.precompute(lazy=False)
+        return vk
+
+    def verify(self, public_key_bytes, message, signature):
+        try:
+            return self.load_public(public_key_bytes).verify(signature, message)
+        except BadSignatureError:
+            return False
+
+
+class CoincurveBackend:
+    """libsecp256k1 through coincurve"""
+    name = "coincurve"
+
+    def __init__(self):
+        self.load_public = functools.lru_cache(maxsize=VERIFYING_KEY_CACHE_SIZE)(coincurve.PublicKey)
+
+    def generate(self):
+        return coincurve.PrivateKey().secret
+
+    def load_private(self, private_key_bytes):
+        return coincurve.PrivateKey(private_key_bytes)
+
+    def public_key(self, private_key):
+        return private_key.public_key.format(compressed=False)
+
+    def sign(self, private_key, message):
+        # The 20-byte SHA1 digest left-padded to 32 bytes is the same integer ecdsa signs
+        der = private_key.sign(digest(message).rjust(32, b'\x00'), hasher=None)
+        return join_signature(*sigdecode_der(der, ORDER))
+
+    def verify(self, public_key_bytes, message, signature):
+        r, s = split_signature(signature)
+        # libsecp256k1 only accepts low-S signatures; ecdsa emits either half
+        if s > HALF_ORDER:
+            s = ORDER - s
+        der = sigencode_der(r, s, ORDER)
+        return self.load_public(public_key_bytes).verify(der, digest(message).rjust(32, b'\x00'), hasher=None)
+
+
+class CryptographyBackend:
+    """OpenSSL through the cryptography package"""
+    name = "cryptography"
+
+    def __init__(self):
+        self.load_public = functools.lru_cache(maxsize=VERIFYING_KEY_CACHE_SIZE)(self._load_public)
+        self.algorithm = ec.ECDSA(Prehashed(hashes.SHA1()))
+
+    def generate(self):
+        return ec.generate_private_key(ec.SECP256K1()).private_numbers().private_value.to_bytes(32, 'big')
+
+    def load_private(self, private_key_bytes):
+        secret = int.from_bytes(private_key_bytes, 'big')
+        if not 0 < secret < ORDER:
+            raise ValueError("Private key out of range")
+        return ec.derive_private_key(secret, ec.SECP256K1())
+
+    def public_key(self, private_key):
+        return private_key.public_key().public_bytes(Encoding.X962, PublicFormat.UncompressedPoint)
+
+    def sign(self, private_key, message):
+        der = private_key.sign(digest(message), self.algorithm)
+        return join_signature(*decode_dss_signature(der))
+
+    def _load_public(self, public_key_bytes):
+        return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256K1(), public_key_bytes)
+
+    def verify(self, public_key_bytes, message, signature):
+        der = encode_dss_signature(*split_signature(signature))
+        try:
+            self.load_public(public_key_bytes).verify(der, digest(message), self.algorithm)
+            return True
+        except InvalidSignature:
+            return False
+
+
+BACKENDS = {"ecdsa": EcdsaBackend}
+if ec is not None:
+    BACKENDS["cryptography"] = CryptographyBackend
+if coincurve is not None:
+    BACKENDS["coincurve"] = CoincurveBackend
+
+PREFERENCE = ("coincurve", "cryptography", "ecdsa")
+
+
+def available_backends():
+    """Names of the installed backends, fastest first"""
+    return [name for name in PREFERENCE if name in BACKENDS]
+
+
+def select_backend(name=None):
+    """
+    Instantiate a backend by name, or the fastest installed one
+
+    Args:
+        name: Backend name (default: MEDITRUST_CRYPTO_BACKEND, else auto-select)
+    """
+    name = name or os.environ.get("MEDITRUST_CRYPTO_BACKEND")
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"Crypto backend '{name}' is not installed (available: {available_backends()})")
+        return BACKENDS[name]()
+    return BACKENDS[available_backends()[0]]()
@@ -0,0 +1,128 @@
+"""
+Canonical binary encoding of health blocks
+
+Layout (all integers big-endian):
+
+    version          u8
+    timestamp        i64   microseconds since 1970-01-01 (naive local time)
+    expiry_date      i64   microseconds since 1970-01-01
+    field lengths    u16 x4 (patient_id, access_level, previous_hash, creator_address), u32 (data)
+    fields           UTF-8 strings, then data as canonical JSON
+
+Version 2 sorts data keys and is what block hashes are computed over.
+Version 1 keeps data in insertion order and only exists so blocks hashed with
+the legacy str() concatenation can be stored and reloaded unchanged.
+Version 3 is a block whose payload lives in the blob store: its data field is
+the raw sha256 of the payload's canonical JSON, so the block hash still covers
+the content. Stored records append the raw 32-byte block hash to the encoding.
+"""
+import datetime
+import json
+import struct
+
+ENCODING_VERSION = 2
+LEGACY_VERSION = 1
+BLOB_VERSION = 3
+
+HEADER = struct.Struct('>BqqHHHHI')
+HASH_SIZE = 32
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+_canonical = json.JSONEncoder(sort_keys=True, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+_ordered = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def to_micros(dt):
+    return (dt - EPOCH) // ONE_MICROSECOND
+
+
+def from_micros(micros):
+    return EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def encode_block(block, version=ENCODING_VERSION):
+    """Encode the hashed fields of a block"""
+    encoder = _canonical if version >= ENCODING_VERSION else _ordered
+    patient_id = str(block.patient_id).encode()
+    access_level = block.access_level.encode()
+    previous_hash = block.previous_hash.encode()
+    creator_address = block.creator_address.encode()
+    if version >= BLOB_VERSION:
+        data = block.payload.digest
+    else:
+        data = encoder.encode(block.data).encode()
+    return b''.join((
+        HEADER.pack(version, block.timestamp_us, block.expiry_us,
+                    len(patient_id), len(access_level), len(previous_hash),
+                    len(creator_address), len(data)),
+        patient_id, access_level, previous_hash, creator_address, data
+    ))
+
+
+def canonical_json(data):
+    """Canonical JSON bytes of a payload, as hashed into version 2 blocks"""
+    return _canonical.encode(data).encode()
+
+
+def encode_record(block):
+    """Encode a block for storage or the wire: fields plus its stored hash"""
+    return encode_block(block, block.hash_version) + block.digest
+
+
+def decode_records(payloads):
+    """
+    Decode stored records into field dicts
+
+    Times are returned as epoch microseconds and the block hash as its raw
+    digest, the way HealthBlock keeps them. Data payloads of a batch are parsed with a single json.loads call;
+    blob-store blocks get data None and their payload digest instead.
+    Records written as JSON before the binary encoding existed are accepted.
+    """
+    records = []
+    pending = []  # binary records still waiting for their data
+    data_chunks = []
+    for payload in payloads:
+        if payload[:1] == b'{':
+            record = json.loads(payload)
+            record['timestamp_us'] = to_micros(datetime.datetime.fromisoformat(record.pop('timestamp')))
+            record['expiry_us'] = to_micros(datetime.datetime.fromisoformat(record.pop('expiry_date')))
+            record['digest'] = bytes.fromhex(record.pop('hash'))
+            record['hash_version'] = LEGACY_VERSION
+            records.append(record)
+            continue
+
+        (version, timestamp, expiry_date, patient_len, level_len, previous_len,
+         creator_len, data_len) = HEADER.unpack_from(payload)
+        offset = HEADER.size
+        fields = []
+        for length in (patient_len, level_len, previous_len, creator_len):
+            fields.append(payload[offset:offset + length].decode())
+            offset += length
+        data = payload[offset:offset + data_len]
+        offset += data_len
+
+        record = {
+            'patient_id': fields[0],
+            'access_level': fields[1],
+            'previous_hash': fields[2],
+            'creator_address': fields[3],
+            'timestamp_us': timestamp,
+            'expiry_us': expiry_date,
+            'digest': payload[offset:offset + HASH_SIZE],
+            'hash_version': version
+        }
+        records.append(record)
+        if version >= BLOB_VERSION:
+            record['data'] = None
+            record['payload_digest'] = data
+        else:
+            pending.append(record)
+            data_chunks.append(data)
+
+    if pending:
+        data = json.loads(b'[' + b','.join(data_chunks) + b']')
+        for record, value in zip(pending, data):
+            record['data'] = value
+
+    return records
@@ -0,0 +1,67 @@
+"""
+Merkle trees over batches of block hashes
+
+Leaves are sha256(0x00 || block_hash) and inner nodes sha256(0x01 || left || right),
+so a leaf can never be passed off as an inner node. An odd node at the end of a
+level is carried up unchanged rather than duplicated.
+"""
+import hashlib
+
+
+def leaf_hash(block_hash):
+    return hashlib.sha256(b'\x00' + bytes.fromhex(block_hash)).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def build_levels(block_hashes):
+    """All tree levels, from leaves up to the single root"""
+    level = [leaf_hash(h) for h in block_hashes]
+    levels = [level]
+    while len(level) > 1:
+        level = [
+            node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(block_hashes):
+    """Hex Merkle root of a list of hex block hashes"""
+    if not block_hashes:
+        return None
+    return build_levels(block_hashes)[-1][0].hex()
+
+
+def merkle_proof(block_hashes, index):
+    """
+    Inclusion proof for block_hashes[index]
+
+    Returns:
+        List of {'position': 'left' or 'right', 'hash': hex} siblings, leaf to root
+    """
+    proof = []
+    for level in build_levels(block_hashes)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({
+                'position': 'left' if sibling < index else 'right',
+                'hash': level[sibling].hex()
+            })
+        index //= 2
+    return proof
+
+
+def verify_proof(block_hash, proof, root):
+    """Check that block_hash is included under root"""
+    current = leaf_hash(block_hash)
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        if step['position'] == 'left':
+            current = node_hash(sibling, current)
+        else:
+            current = node_hash(current, sibling)
+    return current.hex() == root
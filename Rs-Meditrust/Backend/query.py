@@ -0,0 +1,174 @@
+"""
+Secondary indexes and query planning over block contents
+
+BlockIndex keeps the heights of blocks per creator address, per access level
+and, for selected payload keys, per value. Heights are appended in chain order,
+so every index entry is a sorted array('q') and a cursor is a bisect away.
+Payload-key indexes are built on the first query that needs them and kept up
+to date afterwards; the build scans the chain outside the chain's write_lock
+and only catches up on blocks appended meanwhile under it.
+
+A Query holds the filters of one request. Its plan picks the most selective
+available index (fewest candidate heights); the remaining filters are checked
+against each candidate block.
+"""
+import bisect
+from array import array
+
+INDEXABLE_TYPES = (str, int, float, bool)
+
+
+class BlockIndex:
+    def __init__(self, data_keys=()):
+        """
+        Args:
+            data_keys: Payload keys that may be indexed by value
+        """
+        self.data_keys = frozenset(data_keys)
+        self.by_creator = {}  # {creator_address: array of heights}
+        self.by_level = {}  # {access_level: array of heights}
+        self.by_data = {}  # {key: {value: array of heights}} for keys built so far
+
+    def add(self, height, block, data=None):
+        """
+        Index a newly appended block (caller holds the chain's write_lock)
+
+        Args:
+            data: The block's payload content if the caller still has it, so a
+                  blob-store payload is not read back under the lock
+        """
+        heights = self.by_creator.get(block.creator_address)
+        if heights is None:
+            heights = self.by_creator[block.creator_address] = array('q')
+        heights.append(height)
+        heights = self.by_level.get(block.access_level)
+        if heights is None:
+            heights = self.by_level[block.access_level] = array('q')
+        heights.append(height)
+        if self.by_data:
+            self.add_data(height, block.data if data is None else data, self.by_data)
+
+    @staticmethod
+    def add_data(height, data, indexes):
+        if not isinstance(data, dict):
+            return
+        for key, values in indexes.items():
+            value = data.get(key)
+            if isinstance(value, INDEXABLE_TYPES):
+                heights = values.get(value)
+                if heights is None:
+                    heights = values[value] = array('q')
+                heights.append(height)
+
+    def scan_data(self, key, chain, start, end, values=None):
+        """
+        Index a payload key over chain heights start..end-1
+
+        Appended blocks never change, so this needs no lock; it may load
+        blob-store payloads.
+
+        Returns:
+            {value: array of heights}, extended in place when values is given
+        """
+        values = {} if values is None else values
+        for height in range(start, end):
+            self.add_data(height, chain[height].data, {key: values})
+        return values
+
+    def set_data_index(self, key, values):
+        """Keep a scanned payload index up to date from now on (caller holds write_lock)"""
+        if key in self.data_keys:
+            self.by_data.setdefault(key, values)
+
+    def state(self):
+        """Creator and access-level indexes for snapshots; payload indexes are rebuilt on demand"""
+        return {'by_creator': self.by_creator, 'by_level': self.by_level}
+
+    def restore(self, state):
+        self.by_creator = state['by_creator']
+        self.by_level = state['by_level']
+        self.by_data = {}
+
+
+class Query:
+    def __init__(self, patient_id=None, creator_address=None, access_level=None,
+                 since_us=None, until_us=None, data=None):
+        """
+        Args:
+            patient_id: Only blocks of this patient
+            creator_address: Only blocks added by this address
+            access_level: public, private or patient
+            since_us: Only blocks created at or after this epoch time (microseconds)
+            until_us: Only blocks created before this epoch time (microseconds)
+            data: {key: value} payload equality filters
+        """
+        self.patient_id = patient_id
+        self.creator_address = creator_address
+        self.access_level = access_level
+        self.since_us = since_us
+        self.until_us = until_us
+        self.data = data or {}
+
+    def candidates(self, blockchain, tip):
+        """
+        Candidate heights from the most selective index
+
+        Returns:
+            (index name, sorted sequence of heights)
+        """
+        options = []
+        if self.patient_id is not None:
+            positions = blockchain.patient_blocks.get(self.patient_id, {})
+            if self.access_level is not None:
+                options.append(('patient+access_level', positions.get(self.access_level, ())))
+            else:
+                options.append(('patient', positions.get('all', ())))
+        if self.creator_address is not None:
+            options.append(('creator', blockchain.block_index.by_creator.get(self.creator_address, ())))
+        if self.access_level is not None:
+            options.append(('access_level', blockchain.block_index.by_level.get(self.access_level, ())))
+        if self.since_us is not None or self.until_us is not None:
+            options.append(('time', blockchain.height_range(self.since_us, self.until_us, tip)))
+        for key, value in self.data.items():
+            values = blockchain.block_index.by_data.get(key)
+            if values is not None:
+                options.append((f'data.{key}', values.get(value, ()) if isinstance(value, INDEXABLE_TYPES) else ()))
+        if not options:
+            return 'scan', range(1, tip)
+        return min(options, key=lambda option: len(option[1]))
+
+    def matches(self, block, index=None):
+        """
+        Check the filters against a candidate block
+
+        Args:
+            block: Candidate HealthBlock
+            index: Name of the index that produced the candidate; its filter
+                   already holds (for a payload key, without reading the
+                   payload back; for time, by the chain's clamped time index)
+        """
+        indexed_key = index[5:] if index and index.startswith('data.') else None
+        if self.patient_id is not None and block.patient_id != self.patient_id:
+            return False
+        if self.creator_address is not None and block.creator_address != self.creator_address:
+            return False
+        if self.access_level is not None and block.access_level != self.access_level:
+            return False
+        if index != 'time':
+            if self.since_us is not None and block.timestamp_us < self.since_us:
+                return False
+            if self.until_us is not None and block.timestamp_us >= self.until_us:
+                return False
+        if self.data and (indexed_key is None or len(self.data) > 1):
+            data = block.data
+            if not isinstance(data, dict):
+                return False
+            for key, value in self.data.items():
+                if key != indexed_key and (key not in data or data[key] != value):
+                    return False
+        return True
+
+    @staticmethod
+    def start(heights, after):
+        """Position of the first candidate above the cursor height"""
+        return bisect.bisect_right(heights, after) if after is not None else 0
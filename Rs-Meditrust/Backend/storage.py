@@ -0,0 +1,320 @@
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from encoding import encode_record, decode_records
+
+
+def segment_file(directory, number):
+    return os.path.join(directory, f"segment-{number:08d}.log")
+
+
+class BlockStore:
+    """
+    Append-only, segmented on-disk log of encoded blocks
+
+    Each record is framed as <length:u32><crc32:u32><payload>. Records are
+    written to segment-NNNNNNNN.log files which roll over once they reach
+    segment_bytes. Every append is flushed to the OS before it returns, so a
+    process crash loses nothing; fsyncs are batched every sync_every records,
+    and a timer fsyncs any remainder within sync_interval seconds.
+    """
+    HEADER = struct.Struct('>II')
+    LOAD_BATCH = 10000
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, sync_every=100, sync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.offsets = []  # [(segment_number, offset)] indexed by block height
+        self.segments = []  # [segment_number]
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.file = None
+        self.lock = threading.RLock()  # appends vs the background sync timer
+        self.timer = None  # pending threading.Timer for unsynced records
+        self.failed = None  # OSError that left the active segment unrecoverable
+        os.makedirs(directory, exist_ok=True)
+
+    def segment_path(self, number):
+        return segment_file(self.directory, number)
+
+    def load(self):
+        """
+        Scan all segments and yield stored records in append order
+
+        Rebuilds the offset index as it goes. A torn record at the end of the
+        last segment (e.g. from a crash mid-write) is truncated away.
+        """
+        self.segments = sorted(
+            int(name[8:16]) for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        self.offsets = []
+
+        for number in self.segments:
+            path = self.segment_path(number)
+            size = os.path.getsize(path)
+            if size == 0:
+                continue
+
+            valid_end = 0
+            payloads = []
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                offset = 0
+                while offset + self.HEADER.size <= size:
+                    length, checksum = self.HEADER.unpack_from(view, offset)
+                    start = offset + self.HEADER.size
+                    payload = view[start:start + length]
+                    if len(payload) < length or zlib.crc32(payload) != checksum:
+                        break
+                    self.offsets.append((number, offset))
+                    payloads.append(payload)
+                    offset = valid_end = start + length
+
+                    if len(payloads) >= self.LOAD_BATCH:
+                        yield from self.decode_many(payloads)
+                        payloads = []
+
+            yield from self.decode_many(payloads)
+
+            if valid_end < size:
+                print(f"Truncating torn record in {path} at offset {valid_end}")
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_end)
+
+    def read(self, height):
+        """Read a single record by block height using the offset index"""
+        number, offset = self.offsets[height]
+        with open(self.segment_path(number), 'rb') as f:
+            f.seek(offset)
+            length, _ = self.HEADER.unpack(f.read(self.HEADER.size))
+            return self.decode(f.read(length))
+
+    def runs(self, first, last):
+        """
+        Where heights first..last (inclusive) are stored
+
+        Returns:
+            List of (segment number, offset of the first record, record count)
+        """
+        runs = []
+        for number, offset in self.offsets[first:last + 1]:
+            if runs and runs[-1][0] == number:
+                runs[-1][2] += 1
+            else:
+                runs.append([number, offset, 1])
+        return [tuple(run) for run in runs]
+
+    @classmethod
+    def read_run(cls, directory, number, offset, count):
+        """
+        Decode `count` consecutive records of a segment, starting at `offset`
+
+        Only needs the directory, so worker processes can read their share of
+        the log themselves instead of receiving decoded objects.
+
+        Raises:
+            ValueError: On a short or corrupted record
+        """
+        payloads = []
+        with open(segment_file(directory, number), 'rb') as f:
+            f.seek(offset)
+            for _ in range(count):
+                length, checksum = cls.HEADER.unpack(f.read(cls.HEADER.size))
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    raise ValueError(f"Corrupted record in segment {number} at offset {offset}")
+                payloads.append(payload)
+        return cls.decode_many(payloads)
+
+    def append(self, block):
+        """Append one block; it is fsynced within sync_interval seconds"""
+        self.append_many([block])
+
+    def append_many(self, blocks):
+        """Append several blocks with a single write"""
+        frames = []
+        for block in blocks:
+            payload = self.encode(block)
+            frames.append(self.HEADER.pack(len(payload), zlib.crc32(payload)))
+            frames.append(payload)
+
+        with self.lock:
+            if self.failed is not None:
+                raise OSError(f"Store is read-only after an unrecoverable write error: {self.failed}")
+            if self.file is None:
+                self.open_tail()
+            start = position = self.file.tell()
+            offsets = []
+            for i in range(0, len(frames), 2):
+                offsets.append((self.segments[-1], position))
+                position += self.HEADER.size + len(frames[i + 1])
+
+            try:
+                self.file.write(b''.join(frames))
+                self.file.flush()
+            except BaseException:
+                self.discard_tail(start)
+                raise
+            self.offsets.extend(offsets)
+            self.pending += len(blocks)
+
+            if self.pending >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+                self.sync()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.sync_interval, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+
+            if position >= self.segment_bytes:
+                self.roll_segment()
+
+    def discard_tail(self, position):
+        """
+        Cut the active segment back to `position` after a failed write
+
+        Otherwise a torn frame would stay in the segment, and load() would
+        truncate every record appended after it. If the file cannot be cut,
+        the store refuses further appends.
+        """
+        path = self.segment_path(self.segments[-1])
+        try:
+            try:
+                self.file.close()  # drops whatever the failed write left buffered
+            except OSError:
+                pass
+            os.truncate(path, position)
+            self.file = open(path, 'ab')
+        except OSError as e:
+            print(f"Error discarding torn write in {path}: {e}")
+            self.failed = e
+            self.file = None
+
+    def open_tail(self):
+        if not self.segments:
+            self.segments.append(0)
+        self.file = open(self.segment_path(self.segments[-1]), 'ab')
+
+    def roll_segment(self):
+        with self.lock:
+            self.sync()
+            self.file.close()
+            self.segments.append(self.segments[-1] + 1)
+            self.file = open(self.segment_path(self.segments[-1]), 'ab')
+
+    def sync(self):
+        """Flush buffered records and fsync the active segment"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.file is not None and self.pending:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.pending = 0
+            self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.sync()
+                self.file.close()
+                self.file = None
+
+    @staticmethod
+    def encode(block):
+        return encode_record(block)
+
+    @staticmethod
+    def decode(payload):
+        return decode_records([payload])[0]
+
+    @staticmethod
+    def decode_many(payloads):
+        return decode_records(payloads)
+
+
+class EventLog(BlockStore):
+    """
+    Append-only journal of state changes that are not blocks
+
+    Same segmented, CRC-framed layout as BlockStore. Each record is a pickled
+    (seq, kind, args) tuple. Segments that only hold events already covered
+    by a snapshot are dropped with truncate_before().
+    """
+
+    def truncate_before(self, number):
+        """Delete all segments older than segment `number`"""
+        for old in [n for n in self.segments if n < number]:
+            os.remove(self.segment_path(old))
+            self.segments.remove(old)
+        self.offsets = []
+
+    @staticmethod
+    def encode(event):
+        return pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def decode(payload):
+        return pickle.loads(payload)
+
+    @staticmethod
+    def decode_many(payloads):
+        return [pickle.loads(payload) for payload in payloads]
+
+
+SNAPSHOT_MAGIC = b'MTSN'
+SNAPSHOT_HEADER = struct.Struct('>4sBqqI')  # magic, format version, chain height, event seq, crc32
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path, height, seq, payload):
+    """
+    Atomically write a point-in-time snapshot
+
+    The payload is zlib-compressed and written to a temporary file, which is
+    fsynced and renamed over `path`, so a crash leaves either the old or the
+    new snapshot, never a partial one.
+    """
+    payload = zlib.compress(payload, 1)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, height, seq, zlib.crc32(payload))
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    directory = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+    return SNAPSHOT_HEADER.size + len(payload)
+
+
+def read_snapshot(path):
+    """
+    Load a snapshot written by write_snapshot
+
+    Returns:
+        (height, seq, payload), or None if there is no valid snapshot
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        content = f.read()
+    if len(content) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, height, seq, checksum = SNAPSHOT_HEADER.unpack_from(content)
+    payload = content[SNAPSHOT_HEADER.size:]
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or zlib.crc32(payload) != checksum:
+        print(f"Ignoring invalid snapshot {path}")
+        return None
+    return height, seq, zlib.decompress(payload)
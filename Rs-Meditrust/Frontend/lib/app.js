@@ -25,11 +25,13 @@ export async function addHealthData(payload) {
   return res.data;
 }
 
-export async function getPatientData(patient_id, user_address, request_id) {
+// fields: optional projection, e.g. ["timestamp", "created_by", "data.diagnosis"]
+export async function getPatientData(patient_id, user_address, request_id, fields) {
   const res = await api.get(`/patient-data/${patient_id}`, {
     params: {
       user_address,
       request_id: request_id || undefined,
+      fields: fields ? fields.join(",") : undefined,
     },
   });
   return res.data;
@@ -45,6 +47,12 @@ export async function signAccessRequest(payload) {
   return res.data;
 }
 
+// filters: { patient_id, requester, status, signer, cursor, limit }; returns { data, next_cursor }
+export async function listAccessRequests(filters = {}) {
+  const res = await api.get("/access-requests", { params: filters });
+  return res.data;
+}
+
 export async function convertPatient(patient_id) {
   const res = await api.post(`/convert-patient/${patient_id}`);
   return res.data;
@@ -59,3 +67,75 @@ export async function verifyChain() {
   const res = await api.get("/verify-chain");
   return res.data;
 }
+
+// Server-sent change feed: onEvent(type, data, seq) for "block", "conversion", "signature",
+// "request_status" and "reset" (missed events: refetch, then keep applying). Reconnects resume
+// from the last seq automatically; pass options.cursor to resume across page loads.
+// Returns a function that closes the stream.
+export function subscribeChanges(user_address, onEvent, options = {}) {
+  const params = new URLSearchParams({ user_address });
+  for (const key of ["patient_id", "request_id", "cursor", "fields"]) {
+    if (options[key] !== undefined && options[key] !== null) params.set(key, options[key]);
+  }
+  const source = new EventSource(`${API_BASE}/events?${params}`);
+  for (const type of ["block", "conversion", "signature", "request_status", "reset"]) {
+    source.addEventListener(type, (e) => onEvent(type, JSON.parse(e.data), Number(e.lastEventId)));
+  }
+  return () => source.close();
+}
+
+// Streams NDJSON records; onRecord({ height, category, record }) runs as each line arrives
+export async function streamPatientData(patient_id, user_address, request_id, onRecord, cursor) {
+  const params = new URLSearchParams({ user_address, stream: "true" });
+  if (request_id) params.set("request_id", request_id);
+  if (cursor !== undefined && cursor !== null) params.set("cursor", cursor);
+
+  const res = await fetch(`${API_BASE}/patient-data/${patient_id}?${params}`);
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (line) onRecord(JSON.parse(line));
+    }
+  }
+  if (buffer) onRecord(JSON.parse(buffer));
+}
+
+export async function getMerkleProof(block_hash) {
+  const res = await api.get(`/merkle-proof/${block_hash}`);
+  return res.data;
+}
+
+function hexToBytes(hex) {
+  return new Uint8Array(hex.match(/../g).map((byte) => parseInt(byte, 16)));
+}
+
+async function sha256(prefix, ...parts) {
+  const bytes = new Uint8Array(1 + parts.reduce((n, part) => n + part.length, 0));
+  bytes[0] = prefix;
+  let offset = 1;
+  for (const part of parts) {
+    bytes.set(part, offset);
+    offset += part.length;
+  }
+  return new Uint8Array(await crypto.subtle.digest("SHA-256", bytes));
+}
+
+// Mirrors merkle.verify_proof on the backend: leaf = H(0x00 || hash), node = H(0x01 || left || right)
+export async function verifyMerkleProof(block_hash, proof, root) {
+  let current = await sha256(0, hexToBytes(block_hash));
+  for (const step of proof) {
+    const sibling = hexToBytes(step.hash);
+    current = step.position === "left"
+      ? await sha256(1, sibling, current)
+      : await sha256(1, current, sibling);
+  }
+  return Array.from(current, (byte) => byte.toString(16).padStart(2, "0")).join("") === root;
+}